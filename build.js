@@ -37,14 +37,18 @@ function enrichWithLiveQuotes(data) {
   if (!tickers.length) return;
 
   try {
-    const quoteScript = path.join(__dirname, '..', 'scripts', 'quote.py');
+    // quote_cache.py answers from the local cache immediately and refreshes stale
+    // tickers in a detached background process, so this never waits on the network.
+    const quoteScript = path.join(__dirname, 'quote_cache.py');
     const raw = execFileSync('python3', [quoteScript, '--json', ...tickers], {
       cwd: __dirname,
       encoding: 'utf8',
-      timeout: 20000,
+      timeout: 5000,
     });
     const quotes = JSON.parse(raw);
     const byTicker = Object.fromEntries(quotes.filter(q => !q.error).map(q => [q.ticker, q]));
+    const missing = quotes.filter(q => q.error).map(q => q.ticker);
+    const stale = quotes.filter(q => q.stale).map(q => q.ticker);
 
     const applyQuote = (p) => {
       const q = byTicker[p.ticker];
@@ -58,22 +62,102 @@ function enrichWithLiveQuotes(data) {
 
     data.ccPositions = (data.ccPositions || []).map(applyQuote);
     data.cspPositions = (data.cspPositions || []).map(applyQuote);
-    data.quoteUpdatedAt = new Date().toISOString();
-    console.log('💹 Live quotes loaded for:', Object.keys(byTicker).join(', '));
+    const oldest = Object.values(byTicker).map(q => q.updated_at).filter(Boolean).sort()[0];
+    data.quoteUpdatedAt = oldest ? new Date(oldest).toISOString() : new Date().toISOString();
+    console.log('💹 Quotes loaded for:', Object.keys(byTicker).join(', '));
+    if (stale.length) console.warn('⚠️ Stale quotes (refreshing in background):', stale.join(', '));
+    if (missing.length) console.warn('⚠️ No quote available:', missing.join(', '));
   } catch (err) {
     console.warn('⚠️ Failed to load live quotes:', err.message);
   }
 }
 
+// weeklyIncome is precomputed by sync_portfolio.py, but portfolio_data.json is also fixed by hand
+// (see OPERATIONS.md). Recompute it from the current file so the chart never disagrees with the
+// per-week trade list; if that fails, drop it and let the template group the trades itself.
+function refreshWeeklyIncome(data) {
+  try {
+    const raw = execFileSync('python3', [path.join(__dirname, 'income_rollup.py'), '--json', '--portfolio', portfolioPath], {
+      cwd: __dirname,
+      encoding: 'utf8',
+      timeout: 10000,
+    });
+    const fresh = JSON.parse(raw);
+    if (Array.isArray(data.weeklyIncome) && JSON.stringify(data.weeklyIncome) !== JSON.stringify(fresh)) {
+      console.warn('⚠️ weeklyIncome in portfolio_data.json was stale (edited after sync?), recomputed');
+    }
+    data.weeklyIncome = fresh;
+  } catch (err) {
+    console.warn('⚠️ Failed to recompute weeklyIncome, falling back to live grouping:', err.message);
+    delete data.weeklyIncome;
+  }
+}
+
+refreshWeeklyIncome(DATA);
 enrichWithLiveQuotes(DATA);
 
 // Optional decision data (alerts/candidates), also sensitive
+// Prefer the section shards written by decision_engine.py (decision/manifest.json),
+// fall back to the legacy single-file decision_data.json.
+const decisionDir = path.join(__dirname, 'decision');
+const manifestPath = path.join(decisionDir, 'manifest.json');
 const decisionPath = path.join(__dirname, 'decision_data.json');
-if (fs.existsSync(decisionPath)) {
+let decisionDigest = null;
+let decisionExtra = null;
+
+function loadDecisionShards(manifest) {
+  const decision = { generatedAt: manifest.generatedAt, portfolioDate: manifest.portfolioDate };
+  for (const [name, meta] of Object.entries(manifest.sections || {})) {
+    decision[name] = JSON.parse(fs.readFileSync(path.join(decisionDir, meta.file), 'utf8'));
+  }
+  return decision;
+}
+
+// The size-budgeted payload (columnar, rankings truncated) goes into index.html;
+// rarely viewed sections are encrypted separately and fetched by the page on demand.
+function loadDecisionPayload(manifest) {
+  const read = meta => JSON.parse(fs.readFileSync(path.join(decisionDir, meta.file), 'utf8'));
+  const core = read(manifest.payload.core);
+  decisionExtra = manifest.payload.extra ? read(manifest.payload.extra) : {};
+  return { generatedAt: manifest.generatedAt, portfolioDate: manifest.portfolioDate, ...core };
+}
+
+if (fs.existsSync(manifestPath)) {
+  const manifest = JSON.parse(fs.readFileSync(manifestPath, 'utf8'));
+  if (manifest.payload && manifest.payload.core) {
+    DATA.decision = loadDecisionPayload(manifest);
+    console.log('📊 Decision payload loaded: core', manifest.payload.core.bytes, 'bytes, extra',
+      (DATA.decision._payload.extra || []).join(', ') || '(none)');
+  } else {
+    DATA.decision = loadDecisionShards(manifest);
+    console.log('📊 Decision shards loaded:', Object.keys(manifest.sections || {}).length, 'sections');
+  }
+  decisionDigest = manifest.digest;
+} else if (fs.existsSync(decisionPath)) {
   DATA.decision = JSON.parse(fs.readFileSync(decisionPath, 'utf8'));
   console.log('📊 Decision data loaded:', decisionPath);
 }
 
+// Skip re-encrypting when neither portfolio/quotes nor any decision shard changed.
+// generatedAt/quoteUpdatedAt are excluded so an unchanged day doesn't churn index.html.
+const stampPath = path.join(__dirname, '.build_stamp');
+function buildInputDigest(data) {
+  const { decision, quoteUpdatedAt, ...rest } = data;
+  const h = crypto.createHash('sha256');
+  h.update(JSON.stringify(rest));
+  h.update(fs.readFileSync(path.join(__dirname, 'template.html')));
+  h.update(decisionDigest || JSON.stringify(decision || null));
+  return h.digest('hex');
+}
+
+const inputDigest = buildInputDigest(DATA);
+const outputPath = path.join(__dirname, 'index.html');
+if (!process.argv.includes('--force') && fs.existsSync(outputPath) && fs.existsSync(stampPath)
+    && fs.readFileSync(stampPath, 'utf8').trim() === inputDigest) {
+  console.log('⏭️  Inputs unchanged since last build, skipping (use --force to rebuild)');
+  process.exit(0);
+}
+
 // Encrypt
 function encrypt(data, password) {
   const salt = crypto.randomBytes(16);
@@ -94,11 +178,19 @@ function encrypt(data, password) {
 }
 
 const ENC = encrypt(DATA, PASSWORD);
+const extraPath = path.join(__dirname, 'decision_extra.enc.json');
+if (decisionExtra) {
+  fs.writeFileSync(extraPath, JSON.stringify(encrypt(decisionExtra, PASSWORD)));
+} else if (fs.existsSync(extraPath)) {
+  fs.unlinkSync(extraPath);
+}
 
 // Read template and inject
 const template = fs.readFileSync(__dirname + '/template.html', 'utf8');
 const output = template.replace('__ENCRYPTED_DATA__', JSON.stringify(ENC));
-fs.writeFileSync(__dirname + '/index.html', output);
+fs.writeFileSync(outputPath, output);
+fs.writeFileSync(stampPath, inputDigest);
 console.log('✅ Dashboard built successfully');
 console.log('Data size:', JSON.stringify(DATA).length, 'bytes');
 console.log('Encrypted size:', ENC.data.length, 'chars');
+if (decisionExtra) console.log('Extra shard size:', fs.statSync(extraPath).size, 'bytes');
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""capital_history.py — 资金效率时间序列（只追加）
+
+每个 portfolio_date 一行 calc_capital_efficiency 的快照（capital_history.db），
+同时增量维护 4 周 / 13 周滚动均值：
+- capital_rolling 表存每个窗口的累加和 + 窗口尾部 id
+- 新的一天 = 各窗口加上新行，再把滑出窗口的旧行（id > tail_id 且 ts < cutoff）减掉
+- 同一天重跑 = 原地覆盖那一行（ts 不变），仍在窗口里的累加和只加差值；
+  均值按天加权而不是按运行次数，输入没变时 rolling / trend 也不变（不会让决策分片白白重写）
+- 每行只进、出窗口各一次，单次运行摊还 O(1)，与历史长度无关
+
+用法：python3 capital_history.py   # 打印滚动指标 + 最近几行
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+HISTORY_DB = SCRIPT_DIR / 'capital_history.db'
+
+ROLLING_WINDOWS = {
+    '4w': 28,
+    '13w': 91,
+}
+TREND_POINTS = 90
+
+# 参与滚动均值的列：(表列名, 输出字段名)
+METRICS = (
+    ('utilization', 'utilization'),
+    ('working_yield', 'workingYield'),
+    ('total_yield', 'totalYield'),
+    ('dead_money', 'deadMoney'),
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS capital_history (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    portfolio_date TEXT,
+    total_capital INTEGER,
+    deployed INTEGER,
+    cash INTEGER,
+    utilization REAL,
+    working_yield REAL,
+    total_yield REAL,
+    dead_money INTEGER
+);
+CREATE TABLE IF NOT EXISTS capital_rolling (
+    name TEXT PRIMARY KEY,
+    days INTEGER NOT NULL,
+    tail_id INTEGER NOT NULL DEFAULT 0,
+    n INTEGER NOT NULL DEFAULT 0,
+    sum_utilization REAL NOT NULL DEFAULT 0,
+    sum_working_yield REAL NOT NULL DEFAULT 0,
+    sum_total_yield REAL NOT NULL DEFAULT 0,
+    sum_dead_money REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_capital_history_date ON capital_history (portfolio_date);
+'''
+
+
+def connect(db_path=HISTORY_DB):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    for name, days in ROLLING_WINDOWS.items():
+        conn.execute('INSERT OR IGNORE INTO capital_rolling (name, days) VALUES (?, ?)', (name, days))
+    conn.commit()
+    return conn
+
+
+def append(conn, capital_eff, portfolio_date=None, ts=None):
+    """追加（或覆盖同一 portfolio_date 的）一行并增量更新所有滚动窗口
+
+    ts 需单调递增（默认当前时间）；覆盖时保留原 ts。返回行 id
+    """
+    ts = ts or datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    values = (
+        capital_eff.get('utilization', 0),
+        capital_eff.get('workingYield', 0),
+        capital_eff.get('totalYield', 0),
+        capital_eff.get('deadMoney', 0),
+    )
+    cols = [c for c, _ in METRICS]
+    sums = ', '.join(f'sum_{c} = sum_{c} + ?' for c in cols)
+    subs = ', '.join(f'sum_{c} = sum_{c} - ?' for c in cols)
+
+    with conn:
+        existing = conn.execute(f'''
+            SELECT id, {', '.join(cols)} FROM capital_history
+            WHERE portfolio_date = ? ORDER BY id DESC LIMIT 1
+        ''', (portfolio_date,)).fetchone() if portfolio_date else None
+        if existing:
+            row_id, *old = existing
+            conn.execute(f'''
+                UPDATE capital_history
+                SET total_capital = ?, deployed = ?, cash = ?, {', '.join(f'{c} = ?' for c in cols)}
+                WHERE id = ?
+            ''', (capital_eff.get('totalCapital'), capital_eff.get('deployedCapital'),
+                  capital_eff.get('cash'), *values, row_id))
+            # 只有这行还在窗口里（id > tail_id）的窗口需要修正累加和
+            deltas = [(v or 0) - (o or 0) for v, o in zip(values, old)]
+            conn.execute(f'UPDATE capital_rolling SET {sums} WHERE tail_id < ?', (*deltas, row_id))
+            return row_id
+
+        cur = conn.execute(f'''
+            INSERT INTO capital_history
+                (ts, portfolio_date, total_capital, deployed, cash, {', '.join(cols)})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (ts, portfolio_date, capital_eff.get('totalCapital'),
+              capital_eff.get('deployedCapital'), capital_eff.get('cash'), *values))
+        new_id = cur.lastrowid
+        now = datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S')
+
+        for name, days, tail_id in conn.execute(
+                'SELECT name, days, tail_id FROM capital_rolling').fetchall():
+            conn.execute(f'UPDATE capital_rolling SET n = n + 1, {sums} WHERE name = ?',
+                         (*values, name))
+            cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+            expired = conn.execute(f'''
+                SELECT id, {', '.join(cols)} FROM capital_history
+                WHERE id > ? AND id < ? AND ts < ?
+                ORDER BY id
+            ''', (tail_id, new_id, cutoff)).fetchall()
+            for row in expired:
+                conn.execute(f'UPDATE capital_rolling SET n = n - 1, {subs}, tail_id = ? WHERE name = ?',
+                             (*row[1:], row[0], name))
+    return new_id
+
+
+def rolling(conn):
+    """{window: {n, utilization, workingYield, totalYield, deadMoney}}（窗口内均值）"""
+    cols = ', '.join(f'sum_{c}' for c, _ in METRICS)
+    result = {}
+    for row in conn.execute(f'SELECT name, n, {cols} FROM capital_rolling ORDER BY days'):
+        name, n, *sums = row
+        result[name] = {'n': n}
+        for (_, key), total in zip(METRICS, sums):
+            result[name][key] = round(total / n, 1) if n else None
+    return result
+
+
+def trend(conn, limit=TREND_POINTS):
+    """最近 limit 行，按时间升序，供前端画趋势图"""
+    rows = conn.execute('''
+        SELECT ts, utilization, working_yield, dead_money FROM capital_history
+        ORDER BY id DESC LIMIT ?
+    ''', (limit,)).fetchall()
+    return [
+        {'t': ts, 'utilization': u, 'workingYield': y, 'deadMoney': d}
+        for ts, u, y, d in reversed(rows)
+    ]
+
+
+def record(capital_eff, portfolio_date=None, db_path=HISTORY_DB):
+    """decision_engine 调用入口：追加 + 返回 (rolling, trend)"""
+    conn = connect(db_path)
+    try:
+        append(conn, capital_eff, portfolio_date)
+        return rolling(conn), trend(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    if not HISTORY_DB.exists():
+        raise SystemExit(f"❌ Missing {HISTORY_DB}, run decision_engine.py first")
+    conn = connect()
+    try:
+        for name, r in rolling(conn).items():
+            if not r['n']:
+                print(f"{name:4s}  (no data)")
+                continue
+            print(f"{name:4s}  n={r['n']:<4d} 利用率 {r['utilization']}%  "
+                  f"工作收益 {r['workingYield']}%  死钱 ${r['deadMoney']:,.0f}")
+        print()
+        for p in trend(conn, limit=10):
+            print(f"{p['t']}  {p['utilization']:5.1f}%  {p['workingYield']:6.1f}%  ${p['deadMoney']:,}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
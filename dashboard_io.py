@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""dashboard_io.py — 各脚本共用的路径和原子写文件
+
+只依赖标准库：quote_cache.py（build 时调用）、ingest_snapshots.py 之类的小 CLI
+从这里拿 IV_DB / atomic_write_text，不用为此导入整个 decision_engine。
+"""
+import os
+import tempfile
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+IV_DB = SCRIPT_DIR / '..' / 'iv-scanner' / 'data' / 'iv_scanner.db'
+
+
+def atomic_write_text(path, text):
+    """先写同目录临时文件再 os.replace，读方永远看不到写了一半的文件"""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
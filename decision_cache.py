@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""decision_cache.py — decision_engine 各 section 的磁盘结果缓存（LRU，限总大小）
+
+key = sha256(section, 快照指纹, 输入参数/持仓, 代码版本)
+- 快照指纹：每张表的 (最新 date, 最新 date 行数, MAX(rowid), snapshot_meta.data_version)
+  · 新一天的数据 / 追加行 → date、行数或 rowid 变
+  · ingest_snapshots.py 原地 UPSERT 覆盖 → data_version 自增
+  （SQLite 的 PRAGMA data_version 只在单个连接内有效，跨进程不能用，所以自己记）
+- 持仓、参数直接进 key，任何变化都会换 key；代码版本 = decision_engine.py 内容哈希
+- 淘汰：命中时 touch mtime，写入后按 mtime 从旧到新删，直到总大小 ≤ max_bytes
+
+用法：python3 decision_cache.py [--clear]   # 查看 / 清空缓存
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from dashboard_io import atomic_write_text
+
+SCRIPT_DIR = Path(__file__).parent
+CACHE_DIR = SCRIPT_DIR / '.decision_cache'
+MAX_BYTES = 20 * 1024 * 1024
+CODE_VERSION = hashlib.sha256((SCRIPT_DIR / 'decision_engine.py').read_bytes()).hexdigest()[:16]
+
+
+def table_fingerprint(conn, table):
+    latest = conn.execute(f'SELECT MAX(date) FROM {table}').fetchone()[0]
+    count = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE date = ?', (latest,)).fetchone()[0]
+    max_rowid = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0]
+    return [latest, count, max_rowid]
+
+
+def data_version(conn):
+    try:
+        row = conn.execute(
+            "SELECT value FROM snapshot_meta WHERE key = 'data_version'").fetchone()
+    except Exception:
+        return 0
+    return row[0] if row else 0
+
+
+def db_fingerprint(conn, tables=('option_chain_snapshot', 'daily_iv')):
+    return {
+        'dataVersion': data_version(conn),
+        **{t: table_fingerprint(conn, t) for t in tables},
+    }
+
+
+class DecisionCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, enabled=True):
+        self.dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = []
+        self.misses = []
+
+    @staticmethod
+    def make_key(section, inputs):
+        payload = json.dumps([section, CODE_VERSION, inputs],
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, section, key):
+        if not self.enabled:
+            return None
+        path = self.dir / f'{key}.json'
+        try:
+            value = json.loads(path.read_text(encoding='utf-8'))
+            os.utime(path)          # LRU：最近用过的往后排
+        except (OSError, ValueError):
+            self.misses.append(section)
+            return None
+        self.hits.append(section)
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # 原子写：并发读到的永远是完整条目
+        atomic_write_text(self.dir / f'{key}.json',
+                          json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+        self.evict()
+
+    def get_or_compute(self, section, inputs, compute):
+        key = self.make_key(section, inputs)
+        value = self.get(section, key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """按 mtime 从旧到新删，直到总大小不超过 max_bytes"""
+        entries = []
+        for p in self.dir.glob('*.json'):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for p in self.dir.glob('*.json'):
+            p.unlink(missing_ok=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='decision_engine 结果缓存')
+    parser.add_argument('--clear', action='store_true', help='清空缓存')
+    args = parser.parse_args(argv)
+
+    cache = DecisionCache()
+    if args.clear:
+        cache.clear()
+        print(f"🧹 Cleared {CACHE_DIR}")
+        return
+    files = list(CACHE_DIR.glob('*.json')) if CACHE_DIR.exists() else []
+    size = sum(p.stat().st_size for p in files)
+    print(f"{CACHE_DIR}: {len(files)} entries, {size / 1024:.1f} KB / {MAX_BYTES / 1024 / 1024:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
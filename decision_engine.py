@@ -2,25 +2,46 @@
 """
 decision_engine.py — 决策层：从原始数据生成可操作的交易建议
 
-输出 decision_data.json，供 build.js 注入 dashboard
+输出 decision/ 分片（manifest.json 带内容哈希）+ 有体积预算的 dashboard payload，供 build.js 注入 dashboard；
+单文件 decision_data.json 只在内容变化时重写（给没有 manifest 时兜底）
 
 功能：
 1. 80% 止盈追踪
-2. 下周最优 CSP 候选排名（含 delta、OTM%、流动性评分）
+2. 下周最优 CSP 候选排名（含 delta、OTM%、流动性评分；--diversify 按相关性分散）
+   + 全额担保太贵时的 put credit spread 候选（按 credit / 最大亏损 排名）
 3. 到期头寸分析 + 到期后行动建议
-4. 资金效率评分 + 死钱警告
+4. 资金效率评分 + 死钱警告（每次运行追加到 capital_history.db，带 4w/13w 滚动均值）
 5. Wheel 循环下一步建议
-6. 每周操作计划
+6. 现金约束下的 CSP 张数配置（allocation）
+7. 每周操作计划（含浮亏 / 临近到期头寸的 net credit roll 建议，见 roll_engine.py）
 """
+import argparse
+import hashlib
+import heapq
 import json
+import os
 import sqlite3
 import math
+import operator
+import subprocess
+import sys
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import capital_history
+import run_ledger
+from dashboard_io import IV_DB, atomic_write_text
+from decision_cache import DecisionCache, db_fingerprint
+from roll_engine import find_roll_candidates
+
 SCRIPT_DIR = Path(__file__).parent
-IV_DB = SCRIPT_DIR / '..' / 'iv-scanner' / 'data' / 'iv_scanner.db'
 SCREENER_JSON = SCRIPT_DIR / '..' / 'iv-scanner' / 'data' / 'screener_results.json'
+DECISION_DIR = SCRIPT_DIR / 'decision'
+
+# 写进 manifest 而不是分片的字段（每次运行都会变，放进分片会导致分片永远"有变化"）
+MANIFEST_META_KEYS = ('generatedAt', 'portfolioDate')
 
 
 def load_portfolio():
@@ -32,8 +53,22 @@ def load_portfolio():
     return None
 
 
-def get_best_csp_candidates(conn, top_n=10, max_dte=10):
-    """从期权链快照中找最优 CSP 候选"""
+def _iter_batches(cursor, batch_size=2000):
+    """按 fetchmany 分批迭代游标，避免 fetchall 把整张结果集读进内存"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def get_best_csp_candidates(conn, top_n=10, max_dte=10, batch_size=2000):
+    """从期权链快照中找最优 CSP 候选
+
+    流式扫描：游标按 batch_size 分批 fetchmany，只保留每个 ticker 当前最优的一条，
+    最后用堆取 top_n —— 峰值内存只跟 ticker 数有关，跟期权链大小无关。
+    top_n=None 返回每个 ticker 的最优（全部，按 score 降序）。
+    """
     row = conn.execute(
         "SELECT MAX(date) FROM option_chain_snapshot WHERE dte <= ?",
         (max_dte,)).fetchone()
@@ -41,7 +76,7 @@ def get_best_csp_candidates(conn, top_n=10, max_dte=10):
         return []
     latest_date = row[0]
 
-    rows = conn.execute('''
+    cur = conn.execute('''
         SELECT symbol, dte, strike_price, implied_volatility,
                bid_price, ask_price, open_interest, volume, stock_price,
                delta
@@ -52,10 +87,11 @@ def get_best_csp_candidates(conn, top_n=10, max_dte=10):
               AND bid_price > 0
               AND open_interest >= 20
         ORDER BY date DESC
-    ''', (latest_date, max_dte)).fetchall()
+    ''', (latest_date, max_dte))
 
-    candidates = []
-    for r in rows:
+    # 每个 ticker 保留最优的（同分保留先出现的）
+    best_per_ticker = {}
+    for r in _iter_batches(cur, batch_size):
         symbol, dte, strike, iv, bid, ask, oi, vol, price, delta = r
         if dte <= 0 or strike <= 0:
             continue
@@ -96,10 +132,13 @@ def get_best_csp_candidates(conn, top_n=10, max_dte=10):
             elif abs_d > 0.45:
                 delta_score = 0.3
 
-        score = yield_score * liquidity_score * safety_score * delta_score / 10
+        score = round(yield_score * liquidity_score * safety_score * delta_score / 10, 1)
 
         ticker = symbol.replace('US.', '')
-        candidates.append({
+        prev = best_per_ticker.get(ticker)
+        if prev is not None and score <= prev['score']:
+            continue
+        best_per_ticker[ticker] = {
             'ticker': ticker,
             'strike': strike,
             'dte': dte,
@@ -115,18 +154,219 @@ def get_best_csp_candidates(conn, top_n=10, max_dte=10):
             'oi': oi,
             'volume': vol or 0,
             'delta': round(delta, 3) if delta else None,
-            'score': round(score, 1),
-        })
+            'score': score,
+        }
+
+    if top_n is None:
+        return sorted(best_per_ticker.values(), key=lambda x: -x['score'])
+    # nlargest 与 sorted(reverse=True)[:n] 等价（同分保持原顺序）
+    return heapq.nlargest(top_n, best_per_ticker.values(), key=lambda x: x['score'])
+
+
+def load_return_vectors(conn, tickers, lookback=60):
+    """从 daily_iv 的 stock_price 取最近 lookback 个交易日的对数收益
+
+    一次查询拿全部标的，每个标的对齐到同一日期轴，缺失记 0，
+    再去均值、归一化成单位向量 —— 两两点积即相关系数。
+    返回 (latest_date, {ticker: unit_vector})
+    """
+    dates = [r[0] for r in conn.execute(
+        'SELECT DISTINCT date FROM daily_iv ORDER BY date DESC LIMIT ?', (lookback + 1,))]
+    if len(dates) < 3 or not tickers:
+        return None, {}
+    dates.reverse()
+    date_idx = {d: i for i, d in enumerate(dates)}
+
+    symbols = [f'US.{t}' for t in tickers]
+    marks = ', '.join('?' for _ in symbols)
+    prices = {t: [None] * len(dates) for t in tickers}
+    for date, symbol, price in conn.execute(f'''
+            SELECT date, symbol, stock_price FROM daily_iv
+            WHERE date >= ? AND symbol IN ({marks}) AND stock_price > 0
+        ''', (dates[0], *symbols)):
+        prices[symbol.replace('US.', '')][date_idx[date]] = price
+
+    vectors = {}
+    for tk, px in prices.items():
+        rets = [math.log(b / a) if a and b else None for a, b in zip(px, px[1:])]
+        present = [r for r in rets if r is not None]
+        if len(present) < 2:
+            continue
+        mean = sum(present) / len(present)
+        centered = [(r - mean) if r is not None else 0.0 for r in rets]
+        norm = math.sqrt(sum(c * c for c in centered))
+        if norm > 0:
+            vectors[tk] = [c / norm for c in centered]
+    return dates[-1], vectors
+
+
+def correlation_matrix(conn, tickers, lookback=60, cache=None):
+    """候选标的收益相关矩阵：{'tickers': [...], 'matrix': [[...]]}
+
+    缓存 key 用 daily_iv 的快照指纹 + dataVersion（和 run_analyses 一致），同一天重新 ingest 也会失效
+    """
+    tickers = sorted(set(tickers))
+
+    def compute():
+        _, vectors = load_return_vectors(conn, tickers, lookback)
+        names = [t for t in tickers if t in vectors]
+        rows = [vectors[t] for t in names]
+        matrix = [[0.0] * len(names) for _ in names]
+        for i, a in enumerate(rows):
+            matrix[i][i] = 1.0
+            for j in range(i + 1, len(rows)):
+                c = round(sum(map(operator.mul, a, rows[j])), 3)
+                matrix[i][j] = matrix[j][i] = c
+        return {'tickers': names, 'matrix': matrix}
+
+    if cache is None:
+        return compute()
+    fp = db_fingerprint(conn, tables=('daily_iv',))
+    return cache.get_or_compute(
+        'correlation',
+        {'snapshot': fp['daily_iv'], 'dataVersion': fp['dataVersion'],
+         'tickers': tickers, 'lookback': lookback},
+        compute)
+
+
+def select_diversified(candidates, corr, top_n=10, penalty=0.5, max_corr=0.85):
+    """贪心选 top_n：每轮取 score × (1 - penalty × 与已选标的的最大正相关) 最高的
+
+    与已选标的相关 > max_corr 的先跳过，实在凑不够再补。
+    每个候选维护"与已选集合的最大相关"，每选一个只增量更新一次，O(N·top_n)。
+    """
+    idx = {t: i for i, t in enumerate(corr.get('tickers', []))}
+    matrix = corr.get('matrix', [])
+    pool = sorted(candidates, key=lambda x: -x['score'])
+    max_c = [0.0] * len(pool)
+    picked, taken = [], [False] * len(pool)
+
+    for relaxed in (False, True):
+        while len(picked) < top_n:
+            best, best_adj = None, None
+            for k, c in enumerate(pool):
+                if taken[k] or (not relaxed and max_c[k] > max_corr):
+                    continue
+                adj = c['score'] * (1 - penalty * max(0.0, max_c[k]))
+                if best_adj is None or adj > best_adj:
+                    best, best_adj = k, adj
+            if best is None:
+                break
+            taken[best] = True
+            picked.append({**pool[best], 'maxCorr': round(max_c[best], 2)})
+            j_best = idx.get(pool[best]['ticker'])
+            if j_best is None:
+                continue
+            row = matrix[j_best]
+            for k, c in enumerate(pool):
+                j = idx.get(c['ticker'])
+                if j is not None and not taken[k] and row[j] > max_c[k]:
+                    max_c[k] = row[j]
+    return picked
+
+
+# OTM 价差的 credit 超过宽度一半基本是报价失真（long 腿 ask 过期等），直接丢弃
+MAX_SPREAD_CREDIT_RATIO = 0.5
+
+
+def _best_put_spread(symbol, dte, legs, max_width_pct):
+    """同一 (symbol, dte) 的 PUT 腿（strike 升序）里找 credit / 最大亏损 最高的价差
+
+    对每个 short strike，用 bisect 截出 [strike - 最大宽度, strike) 这段 long 腿，
+    只扫窗口内的组合而不是全部 O(n²) 配对。
+    """
+    strikes = [l[0] for l in legs]
+    price = legs[0][5]
+    max_width = price * max_width_pct
+    best = None
+    for i, (short_k, short_bid, _, short_oi, short_delta, _) in enumerate(legs):
+        if short_bid <= 0:
+            continue
+        otm_pct = (1 - short_k / price) * 100
+        if otm_pct < 2:
+            continue
+        for j in range(bisect_left(strikes, short_k - max_width), i):
+            long_k, _, long_ask, long_oi, _, _ = legs[j]
+            if long_ask <= 0 or long_k >= short_k:
+                continue
+            credit = short_bid - long_ask
+            width = short_k - long_k
+            max_loss = width - credit
+            if credit <= 0 or credit > width * MAX_SPREAD_CREDIT_RATIO:
+                continue
+            ratio = credit / max_loss
+            if best is None or ratio > best[0]:
+                best = (ratio, short_k, long_k, credit, width, max_loss, otm_pct,
+                        short_delta, min(short_oi, long_oi))
+    if best is None:
+        return None
+    ratio, short_k, long_k, credit, width, max_loss, otm_pct, short_delta, oi = best
+    return {
+        'ticker': symbol.replace('US.', ''),
+        'shortStrike': short_k,
+        'longStrike': long_k,
+        'dte': dte,
+        'price': round(price, 2),
+        'otmPct': round(otm_pct, 1),
+        'width': round(width, 2),
+        'credit': round(credit, 2),
+        'premium': round(credit * 100),
+        'maxLoss': round(max_loss * 100),
+        'cspCollateral': round(short_k * 100),
+        'creditPerRisk': round(ratio, 3),
+        'annRor': round(ratio * 365 / dte * 100, 1),
+        'delta': round(short_delta, 3) if short_delta else None,
+        'oi': oi,
+    }
+
+
+def get_put_credit_spreads(conn, top_n=10, max_dte=10, max_width_pct=0.05, batch_size=2000):
+    """Put credit spread 候选：卖高 strike PUT + 买低 strike PUT，最大亏损 = 宽度 - credit
+
+    流动性过滤与 CSP 相同（IV 非空、OTM、OI ≥ 20）。按 (symbol, dte, strike) 排序流式读取，
+    一个 (symbol, dte) 分组读完就配对，每个 ticker 只保留 credit/最大亏损 最高的一组。
+    """
+    row = conn.execute(
+        "SELECT MAX(date) FROM option_chain_snapshot WHERE dte <= ?",
+        (max_dte,)).fetchone()
+    if not row or not row[0]:
+        return []
+    latest_date = row[0]
+
+    cur = conn.execute('''
+        SELECT symbol, dte, strike_price, bid_price, ask_price, open_interest, delta, stock_price
+        FROM option_chain_snapshot
+        WHERE date = ? AND dte <= ? AND dte > 0 AND option_type = 'PUT'
+              AND implied_volatility IS NOT NULL
+              AND strike_price > 0
+              AND strike_price < stock_price
+              AND open_interest >= 20
+        ORDER BY symbol, dte, strike_price
+    ''', (latest_date, max_dte))
 
-    # 每个 ticker 保留最优的
     best_per_ticker = {}
-    for c in candidates:
-        tk = c['ticker']
-        if tk not in best_per_ticker or c['score'] > best_per_ticker[tk]['score']:
-            best_per_ticker[tk] = c
 
-    result = sorted(best_per_ticker.values(), key=lambda x: -x['score'])
-    return result[:top_n]
+    def flush(group_key, legs):
+        if len(legs) < 2:
+            return
+        spread = _best_put_spread(group_key[0], group_key[1], legs, max_width_pct)
+        if not spread:
+            return
+        prev = best_per_ticker.get(spread['ticker'])
+        if prev is None or spread['creditPerRisk'] > prev['creditPerRisk']:
+            best_per_ticker[spread['ticker']] = spread
+
+    group_key, legs = None, []
+    for symbol, dte, strike, bid, ask, oi, delta, price in _iter_batches(cur, batch_size):
+        if (symbol, dte) != group_key:
+            if group_key:
+                flush(group_key, legs)
+            group_key, legs = (symbol, dte), []
+        legs.append((strike, bid or 0, ask or 0, oi, delta, price))
+    if group_key:
+        flush(group_key, legs)
+
+    return heapq.nlargest(top_n, best_per_ticker.values(), key=lambda x: x['creditPerRisk'])
 
 
 def get_best_cc_candidates(conn, holdings, max_dte=10):
@@ -411,7 +651,108 @@ def calc_capital_efficiency(cc_positions, csp_positions, idle_positions, cash=25
     }
 
 
-def generate_weekly_plan(expiring, csp_candidates, cc_candidates, profit_alerts, capital_eff):
+MAX_TICKER_PCT = 0.4     # 单标的 CSP 担保（含已有持仓）占总资金的上限
+ALLOC_UNIT = 50          # 背包 DP 的担保离散化粒度（美元）
+
+
+def allocate_csp(candidates, cash, existing_positions=(), max_contracts=2,
+                 max_ticker_pct=MAX_TICKER_PCT, total_capital=None):
+    """在现金约束下决定卖哪些 CSP、各卖几张，使权利金最大（有界背包，DP 精确解）
+
+    - 每张合约占用 collateral（strike × 100），总占用 ≤ cash
+    - 每个 ticker 最多 max_contracts 张，且（含已有 CSP 担保）不超过 total_capital × max_ticker_pct
+      （上限按总资金算；没给 total_capital 时退回按 cash 算）
+    - 按 $ALLOC_UNIT 一格对担保做 DP，担保是 50 的倍数时就是最优解；
+      复杂度 O(合约张数 × cash / ALLOC_UNIT)，$25k 现金 ≈ 500 格
+    - blocked 记录没配上的候选是被单标的上限挡掉，还是现金不够
+    """
+    cash = max(0, cash or 0)
+    ticker_cap = max(total_capital or 0, cash) * max_ticker_pct
+    exposure = {}
+    for p in existing_positions:
+        exposure[p['ticker']] = exposure.get(p['ticker'], 0) + (p.get('collateral') or 0)
+
+    # 展开成单张合约（unit），同一候选的多张连续排列
+    units = []
+    capped = []
+    for c in candidates:
+        if c['collateral'] <= 0 or c['premium'] <= 0:
+            continue
+        room = ticker_cap - exposure.get(c['ticker'], 0)
+        n = min(max_contracts, int(room // c['collateral'])) if room > 0 else 0
+        if n == 0:
+            capped.append(c['ticker'])
+        units.extend([c] * n)
+
+    # 0/1 背包（每张合约一个物品）：担保按 $50 一格离散化（strike 以 $0.5 为步长，担保正好是 50 的倍数；
+    # 不整除的向上取整，只会更保守）。dp[c] = 占用 ≤ c 格时的最大权利金，take[i] 记回溯指针
+    weights = [math.ceil(c['collateral'] / ALLOC_UNIT) for c in units]
+    cap = int(cash // ALLOC_UNIT)
+    dp = [0] * (cap + 1)
+    take = []
+    for c, w in zip(units, weights):
+        if w > cap:
+            take.append(None)
+            continue
+        p = c['premium']
+        cand = [v + p for v in dp[:cap + 1 - w]]
+        flags = bytearray(cap + 1)
+        tail = dp[w:]
+        for k, (new, old) in enumerate(zip(cand, tail)):
+            if new > old:
+                tail[k] = new
+                flags[w + k] = 1
+        dp[w:] = tail
+        take.append(flags)
+
+    chosen = [False] * len(units)
+    rest = cap
+    for i in range(len(units) - 1, -1, -1):
+        if take[i] is not None and take[i][rest]:
+            chosen[i] = True
+            rest -= weights[i]
+    used = sum(c['collateral'] for c, ok in zip(units, chosen) if ok)
+
+    orders = {}
+    for i, c in enumerate(units):
+        if not chosen[i]:
+            continue
+        key = (c['ticker'], c['strike'], c['dte'])
+        o = orders.get(key)
+        if o is None:
+            o = orders[key] = {
+                'ticker': c['ticker'],
+                'strike': c['strike'],
+                'dte': c['dte'],
+                'contracts': 0,
+                'collateral': 0,
+                'premium': 0,
+                'annYield': c['annYield'],
+            }
+        o['contracts'] += 1
+        o['collateral'] += c['collateral']
+        o['premium'] += c['premium']
+
+    orders = sorted(orders.values(), key=lambda o: -o['premium'])
+    premium = sum(o['premium'] for o in orders)
+    allocated = {o['ticker'] for o in orders}
+    return {
+        'cash': round(cash),
+        'collateralUsed': round(used),
+        'cashLeft': round(cash - used),
+        'premium': premium,
+        'orders': orders,
+        'blocked': {
+            'tickerCap': capped,
+            'cash': list(dict.fromkeys(c['ticker'] for c in units if c['ticker'] not in allocated)),
+        },
+        'limits': {'maxContracts': max_contracts, 'maxTickerPct': max_ticker_pct,
+                   'tickerCap': round(ticker_cap)},
+    }
+
+
+def generate_weekly_plan(expiring, csp_candidates, cc_candidates, profit_alerts, capital_eff,
+                         roll_candidates=None, allocation=None):
     """生成每周操作建议，按优先级排序"""
     plan = []
 
@@ -446,8 +787,48 @@ def generate_weekly_plan(expiring, csp_candidates, cc_candidates, profit_alerts,
                 'urgency': a['urgency'],
             })
 
-    # P2: 最优 CSP 开仓机会
-    if csp_candidates:
+    # P1: 浮亏 / 临近到期头寸的 net credit roll
+    for r in roll_candidates or []:
+        best = r['rolls'][0]
+        alts = '；'.join(f"${x['strike']} {x['expiry']} 净收 ${x['netCredit']}" for x in r['rolls'][1:])
+        plan.append({
+            'priority': 1,
+            'category': 'roll',
+            'action': (f"🔁 {r['ticker']} {r['type']} ${r['strike']} {r['expiry']} → "
+                       f"roll 到 ${best['strike']} {best['expiry']}，净收 ${best['netCredit']}"
+                       f"（OTM {best['newOtmPct']}%）"),
+            'detail': f"买回 ${r['buyback']} / 卖出 ${best['bid']}" + (f"；备选：{alts}" if alts else ''),
+            'urgency': 'high',
+        })
+
+    # P2: 最优 CSP 开仓机会（有 allocation 时按现金能覆盖的组合给出张数）
+    if allocation is not None and allocation['orders']:
+        for o in allocation['orders']:
+            plan.append({
+                'priority': 2,
+                'category': 'opportunity',
+                'action': (f"💰 CSP {o['ticker']} ${o['strike']} {o['dte']}DTE ×{o['contracts']} — "
+                           f"年化 {o['annYield']}%, 权利金 ${o['premium']}, 担保 ${o['collateral']}"),
+                'urgency': 'medium',
+            })
+    elif csp_candidates:
+        # 一张都配不上：说明是哪个约束挡住的，仍列出前 3 个候选供参考
+        if allocation is not None:
+            blocked = allocation.get('blocked', {})
+            reasons = []
+            if blocked.get('cash'):
+                cheapest = min(c['collateral'] for c in csp_candidates)
+                reasons.append(f"现金 ${allocation['cash']:,} 不够担保（最低需 ${cheapest:,}）")
+            if blocked.get('tickerCap'):
+                limits = allocation['limits']
+                reasons.append(f"{len(blocked['tickerCap'])} 个候选超过单标的上限 "
+                               f"${limits['tickerCap']:,}（总资金 {limits['maxTickerPct']:.0%}）")
+            plan.append({
+                'priority': 3,
+                'category': 'efficiency',
+                'action': "💵 CSP 候选一张都配不上：" + '；'.join(reasons or ['无可用候选']),
+                'urgency': 'low',
+            })
         for c in csp_candidates[:3]:
             plan.append({
                 'priority': 2,
@@ -493,12 +874,322 @@ def cleanup_db(conn):
     return True
 
 
-def main():
+def connect_ro(db_path=IV_DB):
+    """只读连接（mode=ro URI），每个工作进程各开一个"""
+    return sqlite3.connect(f'file:{Path(db_path).resolve()}?mode=ro', uri=True,
+                           check_same_thread=False)
+
+
+def ensure_wal(db_path=IV_DB):
+    """切到 WAL：并发读不被写阻塞（journal_mode 持久化在库文件里，设一次即可）"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _analysis_tasks(pf, today, csp_top_n=10):
+    """互相独立、只读的分析任务：{section: (func, args)}"""
+    # CC 候选：找持仓中没有 CC 覆盖的标的
+    cc_tickers_covered = {p['ticker'] for p in pf.get('ccPositions', [])}
+    # 持仓中满 100 股但没 CC 的
+    idle_can_cc = [p['ticker'] for p in pf.get('idlePositions', [])
+                   if p.get('canCC') and p['ticker'] not in cc_tickers_covered]
+
+    # 80% 止盈追踪
+    all_active = []
+    for p in pf.get('ccPositions', []):
+        all_active.append({**p, 'type': 'CC'})
+    for p in pf.get('cspPositions', []):
+        all_active.append({**p, 'type': 'CSP'})
+
+    tasks = {
+        'cspCandidates': (get_best_csp_candidates, (csp_top_n, 10)),
+        'spreadCandidates': (get_put_credit_spreads, (10, 10)),
+        'ivRankings': (get_iv_rankings, ()),
+        'profitAlerts': (check_profit_targets, (all_active, today)),
+    }
+    if idle_can_cc:
+        tasks['ccCandidates'] = (get_best_cc_candidates, (idle_can_cc, 10))
+    return tasks
+
+
+def _run_readonly(fn, fn_args, db_path):
+    """工作进程入口（模块级，才能被 pickle）：自己开只读连接跑一项分析"""
+    conn = connect_ro(db_path)
+    try:
+        return fn(conn, *fn_args)
+    finally:
+        conn.close()
+
+
+# section → 依赖的表（缓存 key 只取这张表的指纹）；未列出的依赖 option_chain_snapshot
+SECTION_TABLES = {'ivRankings': 'daily_iv'}
+
+
+def run_analyses(pf, today, concurrent=False, db_path=IV_DB, cache=None, csp_top_n=10):
+    """跑所有只读分析
+
+    - 顺序模式：单连接依次执行，最后就地 cleanup_db（原行为）
+    - 并发模式：进程池（worker 数 ≤ CPU 核数）+ 每任务一个只读 WAL 连接；cleanup 由调用方推迟到后台
+      · 各项分析主要是逐行 Python 打分，线程被 GIL 串行化，重叠不了，所以用进程
+      · 多核时总耗时趋近最慢的那一项 + 进程启动开销；单核机器上直接在本进程里依次跑
+        （仍用只读连接、仍推迟 cleanup）
+    - 传入 cache 时，输入（快照指纹 + 参数/持仓）没变的 section 直接读缓存
+    """
+    tasks = _analysis_tasks(pf, today, csp_top_n)
+    results = {}
+    keys = {}
+
+    if cache is not None and cache.enabled:
+        conn = connect_ro(db_path)
+        try:
+            fp = db_fingerprint(conn)
+        finally:
+            conn.close()
+        for name, (fn, fn_args) in list(tasks.items()):
+            keys[name] = cache.make_key(name, {
+                'snapshot': fp[SECTION_TABLES.get(name, 'option_chain_snapshot')],
+                'dataVersion': fp['dataVersion'],
+                'args': fn_args,
+            })
+            hit = cache.get(name, keys[name])
+            if hit is not None:
+                results[name] = hit
+                del tasks[name]
+
+    if not concurrent:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            computed = {name: fn(conn, *fn_args) for name, (fn, fn_args) in tasks.items()}
+            # 清理旧数据
+            cleanup_db(conn)
+        finally:
+            conn.close()
+    elif tasks:
+        ensure_wal(db_path)
+
+        workers = min(len(tasks), os.cpu_count() or 1)
+        if workers <= 1:
+            computed = {name: _run_readonly(fn, fn_args, db_path)
+                        for name, (fn, fn_args) in tasks.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {name: pool.submit(_run_readonly, fn, fn_args, db_path)
+                           for name, (fn, fn_args) in tasks.items()}
+                computed = {name: f.result() for name, f in futures.items()}
+    else:
+        computed = {}
+
+    for name, value in computed.items():
+        if name in keys:
+            cache.put(keys[name], value)
+    results.update(computed)
+    return results
+
+
+def schedule_deferred_cleanup():
+    """在脱离的子进程里跑 cleanup_db（DELETE + 可能的 VACUUM），主流程不等它"""
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), '--cleanup-only'],
+        cwd=str(SCRIPT_DIR), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def _dump_json(obj, compact=False):
+    if compact:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def _content_hash(obj):
+    """与序列化格式无关的内容哈希（compact / indent 切换不影响）"""
+    canonical = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def write_decision_shards(decision, out_dir=DECISION_DIR, compact=False, payload=None):
+    """按 section 分片写出决策数据 + manifest.json
+
+    - 每个 section 一个 <section>.json，manifest 记录 sha256 / 字节数
+    - 只重写内容哈希变化的分片，其余原样保留
+    - manifest.digest 汇总所有分片哈希，下游据此判断是否需要重新 build
+    - payload=(core, extra) 时另写 payload_core.json / payload_extra.json（始终紧凑），
+      记在 manifest.payload，build.js 优先用它
+
+    返回 (manifest, 本次重写的 section 列表)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / 'manifest.json'
+
+    old_manifest = {}
+    if manifest_path.exists():
+        try:
+            old_manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            old_manifest = {}
+    old_sections = old_manifest.get('sections', {})
+    format_changed = old_manifest.get('compact') != compact
+
+    sections = {}
+    written = []
+    for name, value in decision.items():
+        if name in MANIFEST_META_KEYS:
+            continue
+        digest = _content_hash(value)
+        filename = f'{name}.json'
+        shard_path = out_dir / filename
+        prev = old_sections.get(name)
+        if format_changed or not prev or prev.get('sha256') != digest or not shard_path.exists():
+            atomic_write_text(shard_path, _dump_json(value, compact))
+            written.append(name)
+        sections[name] = {
+            'file': filename,
+            'sha256': digest,
+            'bytes': shard_path.stat().st_size,
+        }
+
+    # 上一轮有、这一轮没有的 section：删掉旧分片，免得下游读到过期数据
+    for name, prev in old_sections.items():
+        if name not in sections:
+            stale = out_dir / prev.get('file', f'{name}.json')
+            if stale.exists():
+                stale.unlink()
+
+    payload_meta = {}
+    old_payload = old_manifest.get('payload', {})
+    for part, value in zip(('core', 'extra'), payload or ()):
+        digest = _content_hash(value)
+        filename = f'payload_{part}.json'
+        part_path = out_dir / filename
+        prev = old_payload.get(part)
+        if not prev or prev.get('sha256') != digest or not part_path.exists():
+            atomic_write_text(part_path, _dump_json(value, compact=True))
+            written.append(f'payload:{part}')
+        payload_meta[part] = {
+            'file': filename,
+            'sha256': digest,
+            'bytes': part_path.stat().st_size,
+        }
+
+    hashes = {**sections, **{f'payload:{p}': m for p, m in payload_meta.items()}}
+    manifest = {
+        **{k: decision.get(k) for k in MANIFEST_META_KEYS},
+        'compact': compact,
+        'digest': hashlib.sha256(
+            ''.join(f"{n}:{hashes[n]['sha256']}" for n in sorted(hashes)).encode('utf-8')
+        ).hexdigest(),
+        'sections': sections,
+    }
+    if payload_meta:
+        manifest['payload'] = payload_meta
+    atomic_write_text(manifest_path, _dump_json(manifest, compact))
+    return manifest, written
+
+
+# ── dashboard payload：有体积预算的紧凑版本，build.js 加密进 index.html 的就是它 ──
+PAYLOAD_BUDGET = 64 * 1024     # core payload（紧凑 JSON）的字节上限
+IV_RANKINGS_UI_LIMIT = 20      # 页面 IV 排名只展示前 20
+# 很少看的 section：完整版只进 extra 分片，页面展开时再单独加载、解密
+EXTRA_SECTIONS = ('ivRankings', 'spreadCandidates', 'capitalTrend')
+# core 超预算时按顺序整块挪进 extra；weeklyPlan / 到期、止盈提醒 / 配置 / 资金效率始终留在 core
+DEMOTE_ORDER = ('rollCandidates', 'ccCandidates', 'cspCandidates')
+
+
+def _columnar(value):
+    """dict 列表 → {'cols': [...], 'rows': [[...], ...]}，键名只出现一次；递归处理嵌套
+
+    缺失的键在 rows 里是 null；前端 fromColumns 还原成对象数组
+    """
+    if isinstance(value, list):
+        if value and all(isinstance(v, dict) for v in value):
+            cols = list(dict.fromkeys(k for v in value for k in v))
+            return {'cols': cols, 'rows': [[_columnar(v.get(c)) for c in cols] for v in value]}
+        return [_columnar(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _columnar(v) for k, v in value.items()}
+    return value
+
+
+def build_dashboard_payload(decision, budget=PAYLOAD_BUDGET, iv_limit=IV_RANKINGS_UI_LIMIT):
+    """拆成 (core, extra) 两个列式 payload
+
+    - core：页面首屏要用的 section，ivRankings 截到 iv_limit 条
+    - extra：EXTRA_SECTIONS 的完整数据
+    - core 紧凑 JSON 超过 budget 时：先对半砍 ivRankings，再按 DEMOTE_ORDER 整块挪进 extra；
+      剩下的都挪不动时宁可超预算（_payload.overBudget 标出来）
+    core['_payload'] 记录 extra 里有哪些 section、截断情况和字节数
+    """
+    sections = {k: v for k, v in decision.items() if k not in MANIFEST_META_KEYS}
+    core = {k: v for k, v in sections.items() if k not in EXTRA_SECTIONS}
+    extra = {k: sections[k] for k in EXTRA_SECTIONS if k in sections}
+
+    iv = sections.get('ivRankings') or []
+    core['ivRankings'] = iv[:iv_limit]
+    demote = [k for k in DEMOTE_ORDER if k in core]
+    while True:
+        encoded = {k: _columnar(v) for k, v in core.items()}
+        size = len(_dump_json(encoded, compact=True).encode('utf-8'))
+        if size <= budget:
+            break
+        if core['ivRankings']:
+            core['ivRankings'] = core['ivRankings'][:len(core['ivRankings']) // 2]
+        elif demote:
+            name = demote.pop(0)
+            extra[name] = core.pop(name)
+        else:
+            break
+
+    encoded['_payload'] = {
+        'extra': sorted(extra),
+        'ivRankingsShown': len(core['ivRankings']),
+        'ivRankingsTotal': len(iv),
+        'bytes': size,
+        'budget': budget,
+        'overBudget': size > budget,
+    }
+    return encoded, {k: _columnar(v) for k, v in extra.items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='生成 dashboard 决策数据')
+    parser.add_argument('--compact', action='store_true',
+                        help='紧凑 JSON 输出（无缩进），减小分片体积')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='多进程并发跑各项分析（只读 WAL 连接，worker 数 ≤ CPU 核数），清理推迟到后台')
+    parser.add_argument('--no-history', action='store_true',
+                        help='不追加资金效率时间序列（重复调试时用）')
+    parser.add_argument('--diversify', action='store_true',
+                        help='CSP 候选按收益相关性分散选择（避免同涨同跌的一篮子）')
+    parser.add_argument('--max-ticker-pct', type=float, default=MAX_TICKER_PCT, metavar='PCT',
+                        help=f'CSP 配置时单标的担保占总资金的上限（默认 {MAX_TICKER_PCT}）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不读写 section 结果缓存（.decision_cache/）')
+    parser.add_argument('--payload-budget', type=int, default=PAYLOAD_BUDGET, metavar='BYTES',
+                        help=f'dashboard core payload 的字节上限（默认 {PAYLOAD_BUDGET}），'
+                             '超出部分挪进单独加载的 extra 分片')
+    parser.add_argument('--cleanup-only', action='store_true',
+                        help='只执行数据库清理（供 --concurrent 的后台任务调用）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cleanup_only:
+        if IV_DB.exists():
+            conn = sqlite3.connect(str(IV_DB))
+            try:
+                cleanup_db(conn)
+            finally:
+                conn.close()
+        return None
+
     pf = load_portfolio()
     if not pf:
         print("⚠️  No portfolio_data.json, run sync_portfolio.py first")
         print("   Falling back to build.js extraction...")
-        import subprocess
         subprocess.run(['python3', str(SCRIPT_DIR / 'sync_portfolio.py')], check=True)
         pf = load_portfolio()
         if not pf:
@@ -506,37 +1197,30 @@ def main():
             return
 
     today = pf.get('updatedAt', datetime.now().strftime('%Y-%m-%d'))
+    cache = DecisionCache(enabled=not args.no_cache)
 
-    # 连接 IV 数据库
-    conn = None
     csp_candidates = []
     cc_candidates = []
+    spread_candidates = []
     iv_rankings = []
     profit_alerts = []
 
     if IV_DB.exists():
-        conn = sqlite3.connect(str(IV_DB))
-        csp_candidates = get_best_csp_candidates(conn, top_n=10, max_dte=10)
-        iv_rankings = get_iv_rankings(conn)
-
-        # CC 候选：找持仓中没有 CC 覆盖的标的
-        cc_tickers_covered = {p['ticker'] for p in pf.get('ccPositions', [])}
-        # 持仓中满 100 股但没 CC 的
-        idle_can_cc = [p['ticker'] for p in pf.get('idlePositions', [])
-                       if p.get('canCC') and p['ticker'] not in cc_tickers_covered]
-        if idle_can_cc:
-            cc_candidates = get_best_cc_candidates(conn, idle_can_cc, max_dte=10)
-
-        # 80% 止盈追踪
-        all_active = []
-        for p in pf.get('ccPositions', []):
-            all_active.append({**p, 'type': 'CC'})
-        for p in pf.get('cspPositions', []):
-            all_active.append({**p, 'type': 'CSP'})
-        profit_alerts = check_profit_targets(conn, all_active, today)
-
-        # 清理旧数据
-        cleanup_db(conn)
+        # 分散模式先拿每个标的的最优 CSP（不截断），再按相关性贪心选
+        results = run_analyses(pf, today, concurrent=args.concurrent, cache=cache,
+                               csp_top_n=None if args.diversify else 10)
+        csp_candidates = results.get('cspCandidates', [])
+        if args.diversify and csp_candidates:
+            conn = connect_ro(IV_DB)
+            try:
+                corr = correlation_matrix(conn, [c['ticker'] for c in csp_candidates], cache=cache)
+            finally:
+                conn.close()
+            csp_candidates = select_diversified(csp_candidates, corr, top_n=10)
+        iv_rankings = results.get('ivRankings', [])
+        cc_candidates = results.get('ccCandidates', [])
+        spread_candidates = results.get('spreadCandidates', [])
+        profit_alerts = results.get('profitAlerts', [])
 
     # 到期分析
     all_positions = []
@@ -546,16 +1230,39 @@ def main():
         all_positions.append({**p, 'type': 'CSP'})
     expiring = analyze_expiring_positions(all_positions, today)
 
+    # 浮亏 / 临近到期 → 找 net credit roll
+    roll_candidates = []
+    if IV_DB.exists():
+        conn = connect_ro(IV_DB)
+        try:
+            roll_candidates = find_roll_candidates(conn, profit_alerts, expiring, all_positions)
+        finally:
+            conn.close()
+
     # 资金效率
-    capital_eff = calc_capital_efficiency(
+    capital_args = (
         pf.get('ccPositions', []),
         pf.get('cspPositions', []),
         pf.get('idlePositions', []),
         pf.get('cash', 25000))
+    capital_eff = cache.get_or_compute(
+        'capitalEfficiency', {'args': capital_args},
+        lambda: calc_capital_efficiency(*capital_args))
+
+    # 资金效率时间序列：追加本次快照，取滚动 4w/13w 均值 + 趋势点
+    capital_trend = []
+    if not args.no_history:
+        capital_eff['rolling'], capital_trend = capital_history.record(capital_eff, today)
+
+    # 现金约束下的 CSP 组合
+    allocation = allocate_csp(csp_candidates, capital_eff['cash'], pf.get('cspPositions', []),
+                              max_ticker_pct=args.max_ticker_pct,
+                              total_capital=capital_eff['totalCapital'])
 
     # 每周操作建议
     weekly_plan = generate_weekly_plan(
-        expiring, csp_candidates, cc_candidates, profit_alerts, capital_eff)
+        expiring, csp_candidates, cc_candidates, profit_alerts, capital_eff, roll_candidates,
+        allocation)
 
     # 输出
     decision = {
@@ -565,26 +1272,73 @@ def main():
         'profitAlerts': profit_alerts,
         'cspCandidates': csp_candidates,
         'ccCandidates': cc_candidates,
+        'spreadCandidates': spread_candidates,
+        'rollCandidates': roll_candidates,
         'ivRankings': iv_rankings,
         'capitalEfficiency': capital_eff,
+        'allocation': allocation,
+        'capitalTrend': capital_trend,
         'weeklyPlan': weekly_plan,
     }
 
     out_path = SCRIPT_DIR / 'decision_data.json'
-    with open(out_path, 'w') as f:
-        json.dump(decision, f, indent=2, ensure_ascii=False)
-
-    print(f"✅ Decision data generated: {out_path}")
+    payload = build_dashboard_payload(decision, budget=args.payload_budget)
+    manifest, written = write_decision_shards(decision, DECISION_DIR, compact=args.compact,
+                                              payload=payload)
+    payload_info = payload[0]['_payload']
+    # 单文件版只给没有 manifest 时的 build.js 兜底：分片有变化（即 manifest.digest 变了）才重写
+    if written or not out_path.exists():
+        atomic_write_text(out_path, _dump_json(decision, args.compact))
+        print(f"✅ Decision data generated: {out_path}")
+    else:
+        print(f"✅ Decision data unchanged: {out_path}")
+    print(f"   分片: {DECISION_DIR} (重写 {len(written)}/{len(manifest['sections']) + len(manifest.get('payload', {}))}"
+          + (f": {', '.join(written)}" if written else "") + ")")
+    print(f"   Dashboard payload: core {manifest['payload']['core']['bytes'] / 1024:.1f} KB"
+          f" / 预算 {args.payload_budget / 1024:.0f} KB"
+          f", extra {manifest['payload']['extra']['bytes'] / 1024:.1f} KB ({', '.join(payload_info['extra'])})"
+          + (" ⚠️ 超预算" if payload_info['overBudget'] else ""))
+    if cache.enabled:
+        print(f"   缓存命中: {len(cache.hits)}/{len(cache.hits) + len(cache.misses)}"
+              + (f" ({', '.join(cache.hits)})" if cache.hits else ""))
     print(f"   到期提醒: {len(expiring)} 个")
     print(f"   止盈追踪: {len(profit_alerts)} 个" +
           (f" (🎯 {sum(1 for a in profit_alerts if a['signal']=='take_profit')} 达标)" if profit_alerts else ""))
     print(f"   CSP 候选: {len(csp_candidates)} 个")
     print(f"   CC 候选: {len(cc_candidates)} 个")
-    print(f"   资金利用率: {capital_eff['utilization']}%")
+    print(f"   Put 价差候选: {len(spread_candidates)} 个")
+    print(f"   Roll 建议: {len(roll_candidates)} 个")
+    print(f"   CSP 配置: {sum(o['contracts'] for o in allocation['orders'])} 张, "
+          f"担保 ${allocation['collateralUsed']:,} / 现金 ${allocation['cash']:,}, 权利金 ${allocation['premium']}")
+    print(f"   资金利用率: {capital_eff['utilization']}%" +
+          (f" (4w 均值 {capital_eff['rolling']['4w']['utilization']}%)" if 'rolling' in capital_eff else ""))
     print(f"   操作建议: {len(weekly_plan)} 条")
 
-    if conn:
-        conn.close()
+    ledger = {
+        'cache_hits': len(cache.hits),
+        'cache_misses': len(cache.misses),
+        'shards_written': len(written),
+        'payload_core_bytes': manifest['payload']['core']['bytes'],
+        'payload_extra_bytes': manifest['payload']['extra']['bytes'],
+        'csp_candidates': len(csp_candidates),
+        'weekly_plan': len(weekly_plan),
+    }
+    if IV_DB.exists():
+        conn = connect_ro(IV_DB)
+        try:
+            fp = db_fingerprint(conn)
+        finally:
+            conn.close()
+        # 最新快照那一天的数据量（看规模趋势用）；不是本次实际读取的行数——
+        # section 全部命中缓存时一行都没读，这要看 cache_misses
+        ledger['chain_snapshot_rows'] = fp['option_chain_snapshot'][1]
+        ledger['iv_snapshot_rows'] = fp['daily_iv'][1]
+        ledger['iv_db_bytes'] = IV_DB.stat().st_size
+    run_ledger.record('decision', ledger)
+
+    if IV_DB.exists() and args.concurrent:
+        # 清理放到后台进程，不占决策输出的关键路径
+        schedule_deferred_cleanup()
 
     return decision
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""income_rollup.py — 按到期周归集收入：已实现 / 在途 / 本周总收入
+
+口径见 OPERATIONS.md：
+- 周收益一律按 **到期周** 归属（周一为 key），不按开仓周
+- 已平仓：有 expiry 用 expiry，否则用 closeDate；亏损单（profit < 0）计 profit，否则计 premium
+- 在途：未平仓 CC/CSP 的 premium 计入其到期周
+
+每次都从 closedTrades + 未平仓头寸整体重建（交易量在几百笔量级，重建只要毫秒级，
+也就不存在增量状态和 portfolio_data.json 不一致的问题）。
+sync_portfolio.py 用它生成 portfolio_data.json 里的 weeklyIncome；build.js 每次构建前
+再用 --json 按当前 portfolio_data.json 重算一遍（手改过 JSON 也不会渲染过期的周收益）。
+
+用法：
+  python3 income_rollup.py          # 对 portfolio_data.json 跑基准周回归检查
+  python3 income_rollup.py --json   # 输出 weeklyIncome（JSON），供 build.js 使用
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+PORTFOLIO_JSON = SCRIPT_DIR / 'portfolio_data.json'
+
+# 基准周（到期周口径），见 OPERATIONS.md
+BASELINE_WEEKS = {
+    '2026-03-09': {'realized': 179, 'inFlight': 1363, 'total': 1542},
+}
+
+
+def week_key(date_str):
+    """日期 → 所在周的周一（YYYY-MM-DD），周日归本周（前一个周一）
+
+    template.html / validate_portfolio.js 的 toWeekKey 与此同口径（按 UTC 解析），改一处要三处一起改
+    """
+    if not date_str:
+        return None
+    try:
+        d = datetime.strptime(date_str[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def realized_amount(trade):
+    profit = trade.get('profit')
+    if isinstance(profit, (int, float)) and profit < 0:
+        return profit
+    return trade.get('premium') or 0
+
+
+class WeeklyIncomeRollup:
+    """到期周 → {realized, inFlight, count, openCount} 的聚合（from_portfolio 整体重建）"""
+
+    def __init__(self):
+        self._weeks = {}
+
+    @classmethod
+    def from_portfolio(cls, pf):
+        rollup = cls()
+        for t in pf.get('closedTrades', []):
+            rollup.add_closed_trade(t)
+        for p in pf.get('ccPositions', []) + pf.get('cspPositions', []):
+            rollup.add_open_position(p)
+        return rollup
+
+    def _bucket(self, key):
+        bucket = self._weeks.get(key)
+        if bucket is None:
+            bucket = self._weeks[key] = {'realized': 0, 'inFlight': 0, 'count': 0, 'openCount': 0}
+        return bucket
+
+    def add_closed_trade(self, trade):
+        key = week_key(trade.get('expiry') or trade.get('closeDate'))
+        if not key:
+            return None
+        bucket = self._bucket(key)
+        bucket['realized'] += realized_amount(trade)
+        bucket['count'] += 1
+        return key
+
+    def add_open_position(self, position):
+        key = week_key(position.get('expiry'))
+        if not key:
+            return None
+        bucket = self._bucket(key)
+        bucket['inFlight'] += position.get('premium') or 0
+        bucket['count'] += 1
+        bucket['openCount'] += 1
+        return key
+
+    def week(self, key):
+        bucket = self._weeks.get(key)
+        if not bucket:
+            return {'week': key, 'realized': 0, 'inFlight': 0, 'total': 0, 'count': 0, 'ongoing': False}
+        return {
+            'week': key,
+            'realized': bucket['realized'],
+            'inFlight': bucket['inFlight'],
+            'total': bucket['realized'] + bucket['inFlight'],
+            'count': bucket['count'],
+            'ongoing': bucket['openCount'] > 0,
+        }
+
+    def series(self, limit=None):
+        """按周升序；limit 取最近 N 周"""
+        keys = sorted(self._weeks)
+        if limit:
+            keys = keys[-limit:]
+        return [self.week(k) for k in keys]
+
+
+def check_baseline(rollup, baselines=BASELINE_WEEKS):
+    """基准周回归检查，返回错误列表
+
+    总收入必须一致；已实现/在途的拆分只在该周还有在途单时比对
+    （在途单到期平仓后会整体转入已实现）。
+    """
+    errors = []
+    for key, expected in baselines.items():
+        got = rollup.week(key)
+        if got['total'] != expected['total']:
+            errors.append(f"Week {key} total mismatch: got {got['total']}, expected {expected['total']}")
+        if got['inFlight'] and (got['realized'], got['inFlight']) != (expected['realized'], expected['inFlight']):
+            errors.append(
+                f"Week {key} split mismatch: got realized {got['realized']} / in-flight {got['inFlight']}, "
+                f"expected {expected['realized']} / {expected['inFlight']}")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按到期周归集收入 + 基准周检查')
+    parser.add_argument('--json', action='store_true', help='只输出 weeklyIncome（JSON），不做检查')
+    parser.add_argument('--portfolio', default=str(PORTFOLIO_JSON))
+    args = parser.parse_args(argv)
+
+    path = Path(args.portfolio)
+    if not path.exists():
+        raise SystemExit(f"❌ Missing {path}")
+    pf = json.loads(path.read_text(encoding='utf-8'))
+    rollup = WeeklyIncomeRollup.from_portfolio(pf)
+    if args.json:
+        print(json.dumps(rollup.series(), ensure_ascii=False))
+        return
+
+    for w in rollup.series(limit=6):
+        flag = ' (在途)' if w['ongoing'] else ''
+        print(f"{w['week']}  已实现 ${w['realized']:,}  在途 ${w['inFlight']:,}  合计 ${w['total']:,}{flag}")
+
+    errors = check_baseline(rollup)
+    if errors:
+        print('\n❌ Baseline check failed')
+        for e in errors:
+            print(f'- {e}')
+        sys.exit(1)
+    print('\n✅ Baseline weeks OK')
+
+
+if __name__ == '__main__':
+    main()
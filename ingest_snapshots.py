@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""ingest_snapshots.py — 期权链 / daily_iv 快照批量入库（幂等）
+
+- 输入 JSONL 或 CSV（按扩展名识别），字段名 = 表列名，多余字段忽略
+- 单事务 + executemany 批量写入，按自然键"先删后插"：同一天重跑只会覆盖，不会重复
+  - option_chain_snapshot: (date, symbol, option_type, expiry 或 dte, strike_price)
+  - daily_iv: (date, symbol)
+  - 自然键上建的是普通索引（只为删得快），输入里重复的键保留最后一条
+- 大批量时先删二级索引、灌完再重建（自然键索引保留）
+- 结束打印 rows/s
+
+和 iv-scanner 的 run_daily.py 共用这两张表：run_daily.py 是普通 INSERT，同一天重跑会留下重复行。
+所以默认**不**建唯一索引——建了之后 run_daily.py 重跑同一天会 IntegrityError
+（pipeline 里它的输出被 | tail -5 截掉，很难发现）。
+--dedupe 是一次性的迁移：先报告会删多少重复行，再按自然键保留 rowid 最大的一条、
+建唯一索引，之后改走 UPSERT。只有 run_daily.py 也改成 UPSERT / 先删后插之后才该用。
+--dedupe --dry-run 只报告、不改库。
+
+用法：
+  python3 ingest_snapshots.py --table chain chain_2026-03-13.jsonl
+  python3 ingest_snapshots.py --table iv daily_iv.csv --db path/to/iv_scanner.db
+  python3 ingest_snapshots.py --table chain --dedupe --dry-run    # 看看有多少重复行
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from dashboard_io import IV_DB
+
+BATCH_SIZE = 5000
+REBUILD_INDEX_THRESHOLD = 50000   # 超过这么多行才值得删/建二级索引
+
+TABLES = {
+    'chain': {
+        'name': 'option_chain_snapshot',
+        # 有 expiry 列优先用 expiry，老库只有 dte（同一 date 下 dte 等价于到期日）
+        'key_options': (
+            ('date', 'symbol', 'option_type', 'expiry', 'strike_price'),
+            ('date', 'symbol', 'option_type', 'dte', 'strike_price'),
+        ),
+        'create': '''
+            CREATE TABLE IF NOT EXISTS option_chain_snapshot (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                option_type TEXT NOT NULL,
+                dte INTEGER,
+                strike_price REAL NOT NULL,
+                implied_volatility REAL,
+                bid_price REAL,
+                ask_price REAL,
+                open_interest INTEGER,
+                volume INTEGER,
+                stock_price REAL,
+                delta REAL
+            )
+        ''',
+    },
+    'iv': {
+        'name': 'daily_iv',
+        'key_options': (
+            ('date', 'symbol'),
+        ),
+        'create': '''
+            CREATE TABLE IF NOT EXISTS daily_iv (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                stock_price REAL,
+                atm_iv REAL,
+                atm_dte INTEGER
+            )
+        ''',
+    },
+}
+
+
+def read_records(path):
+    """逐条产出 dict；CSV 空串视为 NULL"""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield {k: (v if v != '' else None) for k, v in row.items()}
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def table_columns(conn, table):
+    return [r[1] for r in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def pick_key(columns, key_options):
+    for key in key_options:
+        if all(c in columns for c in key):
+            return key
+    raise SystemExit(f"❌ No natural key fits columns {columns}")
+
+
+def _index_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone() is not None
+
+
+def count_duplicates(conn, table, key):
+    """(重复组数, 会被删掉的行数)"""
+    cols = ', '.join(key)
+    groups, extra = conn.execute(f'''
+        SELECT COUNT(*), COALESCE(SUM(n - 1), 0) FROM (
+            SELECT COUNT(*) AS n FROM {table} GROUP BY {cols} HAVING n > 1
+        )
+    ''').fetchone()
+    return groups, extra
+
+
+def ensure_key_index(conn, table, key, dedupe=False):
+    """返回 (索引名, 是否唯一, 去重删掉的行数)；需在事务内调用
+
+    - 已有唯一索引（之前 --dedupe 过）：直接用，走 UPSERT
+    - dedupe=True：按 rowid 保留最新一条、删掉其余重复行，再建唯一索引
+    - 否则只建普通索引，写入走先删后插，不影响 run_daily.py 的普通 INSERT
+    """
+    unique_name = f'ux_{table}_natural_key'
+    if _index_exists(conn, unique_name):
+        return unique_name, True, 0
+    cols = ', '.join(key)
+    if dedupe:
+        removed = conn.execute(f'''
+            DELETE FROM {table} WHERE rowid NOT IN (
+                SELECT MAX(rowid) FROM {table} GROUP BY {cols}
+            )
+        ''').rowcount
+        conn.execute(f'DROP INDEX IF EXISTS ix_{table}_natural_key')
+        conn.execute(f'CREATE UNIQUE INDEX {unique_name} ON {table} ({cols})')
+        return unique_name, True, removed
+    conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_natural_key ON {table} ({cols})')
+    return f'ix_{table}_natural_key', False, 0
+
+
+def drop_secondary_indexes(conn, table, keep):
+    """删掉除 keep 以外的显式索引，返回重建用的 SQL"""
+    rows = conn.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL AND name != ?
+    ''', (table, keep)).fetchall()
+    for name, _ in rows:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in rows]
+
+
+def duplicate_report(kind, db_path=IV_DB):
+    """--dedupe 之前先看：{key, groups, rows, unique}，只读"""
+    spec = TABLES[kind]
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        key = pick_key(table_columns(conn, spec['name']), spec['key_options'])
+        groups, rows = count_duplicates(conn, spec['name'], key)
+        unique = _index_exists(conn, f"ux_{spec['name']}_natural_key")
+    finally:
+        conn.close()
+    return {'table': spec['name'], 'key': key, 'groups': groups, 'rows': rows, 'unique': unique}
+
+
+def ingest(paths, kind, db_path=IV_DB, rebuild_indexes='auto', dedupe=False):
+    spec = TABLES[kind]
+    table = spec['name']
+    conn = sqlite3.connect(str(db_path), isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(spec['create'])
+
+        columns = table_columns(conn, table)
+        key = pick_key(columns, spec['key_options'])
+
+        # 只写输入里出现过、且表里存在的列（不碰 id）；同一自然键保留最后一条
+        by_key = {}
+        seen_cols = set()
+        skipped = 0
+        for path in paths:
+            for rec in read_records(path):
+                k = tuple(rec.get(c) for c in key)
+                if any(v is None for v in k):
+                    skipped += 1
+                    continue
+                seen_cols.update(rec)
+                by_key[k] = rec
+        records = list(by_key.values())
+        cols = [c for c in columns if c in seen_cols and c != 'id']
+        placeholders = ', '.join('?' for _ in cols)
+        insert_sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders})"
+        key_cols = ', '.join(key)
+        match = ' AND '.join(f'{c} = ?' for c in key)
+
+        before = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        rebuild = (rebuild_indexes == 'always' or
+                   (rebuild_indexes == 'auto' and len(records) >= REBUILD_INDEX_THRESHOLD))
+
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            key_index, unique, deduped = ensure_key_index(conn, table, key, dedupe)
+            if unique:
+                updates = [c for c in cols if c not in key]
+                conflict = (f"DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updates)}"
+                            if updates else 'DO NOTHING')
+                sql = f"{insert_sql} ON CONFLICT ({key_cols}) {conflict}"
+            existed = replaced = 0
+            dropped = drop_secondary_indexes(conn, table, key_index) if rebuild else []
+            for i in range(0, len(records), BATCH_SIZE):
+                batch = records[i:i + BATCH_SIZE]
+                if unique:
+                    conn.executemany(sql, [tuple(r.get(c) for c in cols) for r in batch])
+                else:
+                    # 没有唯一索引：先删掉库里同键的行（含 run_daily.py 留下的重复），再插入
+                    delete_sql = f'DELETE FROM {table} WHERE {match}'
+                    for r in batch:
+                        n = conn.execute(delete_sql, tuple(r[c] for c in key)).rowcount
+                        existed += n > 0
+                        replaced += n
+                    conn.executemany(insert_sql, [tuple(r.get(c) for c in cols) for r in batch])
+            for index_sql in dropped:
+                conn.execute(index_sql)
+            # UPSERT 原地覆盖不改变行数 / rowid，靠这个版本号让 decision_cache 失效
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS snapshot_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                INSERT INTO snapshot_meta (key, value) VALUES ('data_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1
+            ''')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        elapsed = time.perf_counter() - start
+        after = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+        # UPSERT：净增行数（去重删掉的要加回来）就是新键数；先删后插：逐条数过
+        updated = len(records) - (after - before + deduped) if unique else existed
+        return {
+            'table': table,
+            'key': key,
+            'unique': unique,
+            'rows': len(records),
+            'inserted': len(records) - updated,
+            'updated': updated,
+            'replacedDuplicates': replaced - existed,
+            'skipped': skipped,
+            'deduped': deduped,
+            'indexesRebuilt': len(dropped),
+            'seconds': round(elapsed, 3),
+            'rowsPerSec': round(len(records) / elapsed) if elapsed > 0 else None,
+        }
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量、幂等地导入期权链 / daily_iv 快照')
+    parser.add_argument('files', nargs='*', help='JSONL 或 CSV 文件')
+    parser.add_argument('--table', choices=sorted(TABLES), required=True)
+    parser.add_argument('--db', default=str(IV_DB))
+    parser.add_argument('--rebuild-indexes', choices=('auto', 'always', 'never'), default='auto',
+                        help=f'删/建二级索引（auto: ≥{REBUILD_INDEX_THRESHOLD} 行时）')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='一次性迁移：删掉自然键重复的旧行并建唯一索引（run_daily.py 须已改成 UPSERT）')
+    parser.add_argument('--dry-run', action='store_true', help='配合 --dedupe：只报告重复行，不改库')
+    args = parser.parse_args(argv)
+    if not args.files and not (args.dedupe and args.dry_run):
+        parser.error('需要输入文件（或 --dedupe --dry-run）')
+
+    if args.dedupe and Path(args.db).exists():
+        d = duplicate_report(args.table, Path(args.db))
+        if d['unique']:
+            print(f"ℹ️  {d['table']} 已有唯一索引，无需去重")
+        else:
+            print(f"🧹 {d['table']}: 自然键 ({', '.join(d['key'])}) 重复 {d['groups']} 组，"
+                  f"{'将' if not args.dry_run else '会'}删除 {d['rows']} 行（保留每组 rowid 最大的一条）")
+        if args.dry_run:
+            return d
+
+    r = ingest(args.files, args.table, Path(args.db), args.rebuild_indexes, args.dedupe)
+    print(f"✅ {r['table']}: {r['rows']} rows in {r['seconds']}s ({r['rowsPerSec']} rows/s)")
+    print(f"   新增 {r['inserted']} · 覆盖 {r['updated']} · 跳过 {r['skipped']}"
+          + (f" · 去重旧数据 {r['deduped']}" if r['deduped'] else "")
+          + (f" · 清掉同键旧重复 {r['replacedDuplicates']}" if r['replacedDuplicates'] else "")
+          + (f" · 重建索引 {r['indexesRebuilt']}" if r['indexesRebuilt'] else ""))
+    print(f"   自然键: ({', '.join(r['key'])})" + (" · 唯一索引 / UPSERT" if r['unique'] else " · 先删后插"))
+    return r
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""quote_cache.py — 本地报价缓存，替代 build.js 每次阻塞调用 scripts/quote.py
+
+- 每个 ticker 独立 TTL：新鲜的直接返回；过期的也先返回（stale-while-revalidate），
+  同时起一个后台进程批量刷新，build 永远不等网络
+- 缓存里没有的 ticker 从 iv_scanner.db 做种（option_chain_snapshot / daily_iv 最新 stock_price）
+- 刷新走 asyncio 批量 fetcher：默认调 scripts/quote.py，`--fetcher db` 换成本地替身（不联网）
+- CLI 与 scripts/quote.py 一致：`--json TICKER…` 输出 [{ticker, price, prev_close}, ...]，
+  取不到的 ticker 输出 {ticker, error}
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dashboard_io import IV_DB, atomic_write_text
+
+SCRIPT_DIR = Path(__file__).parent
+CACHE_PATH = SCRIPT_DIR / 'quote_cache.json'
+LOCK_PATH = SCRIPT_DIR / '.quote_cache.lock'
+QUOTE_SCRIPT = SCRIPT_DIR / '..' / 'scripts' / 'quote.py'
+
+DEFAULT_TTL = 300        # 秒；实时抓到的报价 5 分钟内算新鲜
+SEED_TTL = 0             # 数据库做种的价格是收盘快照，一律视为过期，等后台刷新
+BATCH_SIZE = 20
+MAX_CONCURRENCY = 4
+FETCH_TIMEOUT = 20
+LOCK_STALE_AFTER = 120   # 后台刷新锁超过 2 分钟视为残留
+
+
+def load_cache(path=CACHE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(updates, path=CACHE_PATH):
+    """合并写回：先读盘上最新内容再覆盖本次更新的 ticker，避免和后台刷新互相踩"""
+    cache = load_cache(path)
+    cache.update(updates)
+    atomic_write_text(Path(path), json.dumps(cache, ensure_ascii=False, indent=2))
+    return cache
+
+
+def _entry(price, prev_close, source, ttl, fetched_at=None):
+    return {
+        'price': round(price, 4) if price is not None else None,
+        'prev_close': round(prev_close, 4) if prev_close is not None else None,
+        'source': source,
+        'ttl': ttl,
+        'fetchedAt': fetched_at if fetched_at is not None else time.time(),
+    }
+
+
+def seed_from_db(tickers, db_path=IV_DB):
+    """用 IV 数据库里最新的 stock_price 做种；prev_close 取 daily_iv 前一天"""
+    db_path = Path(db_path)
+    if not tickers or not db_path.exists():
+        return {}
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        seeds = {}
+        for ticker in tickers:
+            symbol = f'US.{ticker}'
+            daily = conn.execute('''
+                SELECT date, stock_price FROM daily_iv
+                WHERE symbol = ? AND stock_price IS NOT NULL
+                ORDER BY date DESC LIMIT 2
+            ''', (symbol,)).fetchall()
+            chain = conn.execute('''
+                SELECT date, stock_price FROM option_chain_snapshot
+                WHERE symbol = ? AND stock_price IS NOT NULL
+                ORDER BY date DESC LIMIT 1
+            ''', (symbol,)).fetchone()
+
+            price = prev_close = None
+            as_of = None
+            if daily:
+                as_of, price = daily[0]
+                prev_close = daily[1][1] if len(daily) > 1 else None
+            if chain and (as_of is None or chain[0] > as_of):
+                if price is not None:
+                    prev_close = price
+                as_of, price = chain
+            if price is None:
+                continue
+            fetched_at = datetime.strptime(as_of, '%Y-%m-%d').timestamp()
+            seeds[ticker] = _entry(price, prev_close, f'db:{as_of}', SEED_TTL, fetched_at)
+        return seeds
+    finally:
+        conn.close()
+
+
+def is_fresh(entry, now=None):
+    now = time.time() if now is None else now
+    return now - entry.get('fetchedAt', 0) <= entry.get('ttl', DEFAULT_TTL)
+
+
+# ── fetchers ────────────────────────────────────────────────
+# 签名统一为 async (tickers) -> {ticker: entry}；取不到的 ticker 不出现在结果里
+
+async def script_fetcher(tickers):
+    """调 scripts/quote.py --json 批量抓实时价"""
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, str(QUOTE_SCRIPT), '--json', *tickers,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout=FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return {}
+    if proc.returncode != 0:
+        return {}
+    result = {}
+    for q in json.loads(out or b'[]'):
+        if q.get('error') or q.get('price') is None:
+            continue
+        result[q['ticker']] = _entry(q['price'], q.get('prev_close'), 'quote.py', DEFAULT_TTL)
+    return result
+
+
+async def db_fetcher(tickers):
+    """本地替身：不联网，直接用数据库最新价当作"刷新"结果"""
+    seeds = await asyncio.to_thread(seed_from_db, tickers)
+    return {tk: {**e, 'ttl': DEFAULT_TTL, 'fetchedAt': time.time()} for tk, e in seeds.items()}
+
+
+FETCHERS = {
+    'script': script_fetcher,
+    'db': db_fetcher,
+}
+
+
+async def refresh_quotes(tickers, fetcher=script_fetcher, batch_size=BATCH_SIZE,
+                         concurrency=MAX_CONCURRENCY):
+    """分批并发刷新，单批失败不影响其它批"""
+    sem = asyncio.Semaphore(concurrency)
+    batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+
+    async def run(batch):
+        async with sem:
+            try:
+                return await fetcher(batch)
+            except Exception:
+                return {}
+
+    merged = {}
+    for part in await asyncio.gather(*(run(b) for b in batches)):
+        merged.update(part)
+    return merged
+
+
+def _acquire_refresh_lock():
+    try:
+        fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - LOCK_PATH.stat().st_mtime < LOCK_STALE_AFTER:
+                return False
+            LOCK_PATH.unlink()
+        except FileNotFoundError:
+            pass
+        return _acquire_refresh_lock()
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+
+def spawn_background_refresh(tickers, fetcher_name='script'):
+    """脱离当前进程组跑刷新，调用方（build.js）不用等它"""
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), '--refresh',
+         '--fetcher', fetcher_name, *tickers],
+        cwd=str(SCRIPT_DIR), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def get_quotes(tickers, revalidate=True, fetcher_name='script', cache_path=CACHE_PATH):
+    """立即返回缓存报价（不阻塞网络）；过期的交给后台刷新"""
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    cache = load_cache(cache_path)
+
+    missing = [t for t in tickers if t not in cache]
+    if missing:
+        seeds = seed_from_db(missing)
+        if seeds:
+            cache = save_cache(seeds, cache_path)
+
+    now = time.time()
+    quotes, stale = [], []
+    for tk in tickers:
+        e = cache.get(tk)
+        if not e or e.get('price') is None:
+            quotes.append({'ticker': tk, 'error': 'no cached quote'})
+            stale.append(tk)
+            continue
+        fresh = is_fresh(e, now)
+        if not fresh:
+            stale.append(tk)
+        quotes.append({
+            'ticker': tk,
+            'price': e['price'],
+            'prev_close': e.get('prev_close'),
+            'source': e.get('source'),
+            'stale': not fresh,
+            'updated_at': datetime.fromtimestamp(e['fetchedAt']).isoformat(timespec='seconds'),
+        })
+
+    if revalidate and stale:
+        spawn_background_refresh(stale, fetcher_name)
+    return quotes
+
+
+def run_refresh(tickers, fetcher_name='script', cache_path=CACHE_PATH):
+    if not _acquire_refresh_lock():
+        return {}
+    try:
+        fetched = asyncio.run(refresh_quotes(tickers, FETCHERS[fetcher_name]))
+        if fetched:
+            save_cache(fetched, cache_path)
+        return fetched
+    finally:
+        LOCK_PATH.unlink(missing_ok=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地报价缓存（stale-while-revalidate）')
+    parser.add_argument('tickers', nargs='+')
+    parser.add_argument('--json', action='store_true', help='输出 JSON（与 scripts/quote.py 一致）')
+    parser.add_argument('--refresh', action='store_true', help='同步刷新给定 ticker 并写回缓存')
+    parser.add_argument('--fetcher', choices=sorted(FETCHERS), default='script')
+    parser.add_argument('--no-revalidate', action='store_true', help='只读缓存，不触发后台刷新')
+    args = parser.parse_args(argv)
+
+    if args.refresh:
+        fetched = run_refresh([t.upper() for t in args.tickers], args.fetcher)
+        print(f"🔄 Refreshed {len(fetched)}/{len(args.tickers)} quotes via {args.fetcher}")
+        return
+
+    quotes = get_quotes(args.tickers, revalidate=not args.no_revalidate,
+                        fetcher_name=args.fetcher)
+    if args.json:
+        print(json.dumps(quotes, ensure_ascii=False))
+        return
+    for q in quotes:
+        if q.get('error'):
+            print(f"{q['ticker']:6s}  ❌ {q['error']}")
+        else:
+            flag = ' (stale)' if q['stale'] else ''
+            print(f"{q['ticker']:6s}  ${q['price']:.2f}  prev ${q['prev_close'] or 0:.2f}  "
+                  f"{q['updated_at']}{flag}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""roll_engine.py — 为浮亏 / 临近到期的头寸找净收权利金（net credit）的 roll
+
+输入：check_profit_targets 标成 underwater、analyze_expiring_positions 标成 imminent 的头寸
+做法：
+- 一次查询取出所有相关标的在最新快照里的同类型期权
+- 按 (symbol, option_type) 建 dte 升序数组，每个 dte 下再建 strike 升序数组
+- 每个头寸：bisect 找到当前合约算买回成本（ask；到期差超过 EXPIRY_TOLERANCE 天或 strike 对不上就跳过），再在更远的到期里用 bisect 截出
+  strike 窗口（CSP 只往下 roll，CC 只往上 roll），保留 新 bid - 买回 ask > 0 的组合
+- 按净收权利金、新 OTM% 排序，每个头寸保留前几名
+
+结果写进 decision 的 rollCandidates，并由 generate_weekly_plan 作为 P1 行动项。
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+MAX_EXTRA_DTE = 45       # 最远往后 roll 多少天
+STRIKE_BAND = 0.10       # strike 搜索窗口：当前 strike 的 ±10%（只取有利方向）
+MIN_OI = 10
+EXPIRY_TOLERANCE = 1     # 快照里最接近的到期与头寸到期最多差几天，超过就认为没有这个合约
+TOP_ROLLS = 3
+
+
+def flagged_positions(profit_alerts, expiring, positions=None):
+    """合并两类信号并去重；contracts 从原始持仓里补"""
+    contracts = {}
+    for p in positions or []:
+        contracts[(p['ticker'], p.get('type', 'CC'), p['strike'], p['expiry'])] = p.get('contracts', 1)
+
+    flagged = {}
+    for a in profit_alerts:
+        if a.get('signal') == 'underwater':
+            k = (a['ticker'], a['type'], a['strike'], a['expiry'])
+            flagged.setdefault(k, {'reason': 'underwater', 'profitPct': a.get('profitPct')})
+    for a in expiring:
+        if a.get('status') == 'imminent':
+            k = (a['ticker'], a['type'], a['strike'], a['expiry'])
+            if k in flagged:
+                flagged[k]['reason'] = 'underwater+imminent'
+            else:
+                flagged[k] = {'reason': 'imminent'}
+
+    return [
+        {'ticker': tk, 'type': typ, 'strike': strike, 'expiry': expiry,
+         'contracts': abs(contracts.get((tk, typ, strike, expiry), 1) or 1), **info}
+        for (tk, typ, strike, expiry), info in flagged.items()
+    ]
+
+
+def _load_chains(conn, snapshot_date, symbols):
+    """{(symbol, option_type): (dtes, {dte: (strikes, rows)})}，均为升序"""
+    marks = ', '.join('?' for _ in symbols)
+    rows = conn.execute(f'''
+        SELECT symbol, option_type, dte, strike_price, bid_price, ask_price,
+               open_interest, stock_price
+        FROM option_chain_snapshot
+        WHERE date = ? AND symbol IN ({marks}) AND strike_price > 0
+        ORDER BY symbol, option_type, dte, strike_price
+    ''', (snapshot_date, *symbols)).fetchall()
+
+    chains = {}
+    for symbol, opt_type, dte, strike, bid, ask, oi, price in rows:
+        by_dte = chains.setdefault((symbol, opt_type), {})
+        strikes, contracts = by_dte.setdefault(dte, ([], []))
+        strikes.append(strike)
+        contracts.append((strike, bid or 0, ask or 0, oi or 0, price))
+    return {k: (sorted(v), v) for k, v in chains.items()}
+
+
+def _nearest(sorted_vals, x):
+    i = bisect_left(sorted_vals, x)
+    if i == 0:
+        return 0
+    if i == len(sorted_vals):
+        return i - 1
+    return i if sorted_vals[i] - x < x - sorted_vals[i - 1] else i - 1
+
+
+def find_roll_candidates(conn, profit_alerts, expiring, positions=None, top_n=TOP_ROLLS):
+    flagged = flagged_positions(profit_alerts, expiring, positions)
+    if not flagged:
+        return []
+    row = conn.execute("SELECT MAX(date) FROM option_chain_snapshot").fetchone()
+    if not row or not row[0]:
+        return []
+    snapshot_date = row[0]
+    snap = datetime.strptime(snapshot_date, '%Y-%m-%d').date()
+
+    chains = _load_chains(conn, snapshot_date, sorted({f"US.{p['ticker']}" for p in flagged}))
+
+    results = []
+    for p in flagged:
+        opt_type = 'CALL' if p['type'] == 'CC' else 'PUT'
+        chain = chains.get((f"US.{p['ticker']}", opt_type))
+        if not chain:
+            continue
+        dtes, by_dte = chain
+
+        # 当前合约：最接近剩余天数的到期 + 最接近的 strike（都要足够接近，否则买回价不可信）
+        cur_dte = max(0, (datetime.strptime(p['expiry'], '%Y-%m-%d').date() - snap).days)
+        di = _nearest(dtes, cur_dte)
+        if abs(dtes[di] - cur_dte) > EXPIRY_TOLERANCE:
+            continue
+        strikes, contracts = by_dte[dtes[di]]
+        si = _nearest(strikes, p['strike'])
+        if abs(strikes[si] - p['strike']) >= 0.5:
+            continue
+        _, cur_bid, cur_ask, _, price = contracts[si]
+        buyback = cur_ask or cur_bid
+        if buyback <= 0 or not price:
+            continue
+
+        if opt_type == 'PUT':
+            lo, hi = p['strike'] * (1 - STRIKE_BAND), p['strike']
+        else:
+            lo, hi = p['strike'], p['strike'] * (1 + STRIKE_BAND)
+
+        rolls = []
+        later = bisect_right(dtes, dtes[di])
+        last = bisect_right(dtes, dtes[di] + MAX_EXTRA_DTE)
+        for dte in dtes[later:last]:
+            strikes, contracts = by_dte[dte]
+            for strike, bid, ask, oi, _ in contracts[bisect_left(strikes, lo):bisect_right(strikes, hi)]:
+                credit = bid - buyback
+                if bid <= 0 or oi < MIN_OI or credit <= 0:
+                    continue
+                otm_pct = (1 - strike / price) * 100 if opt_type == 'PUT' else (strike / price - 1) * 100
+                rolls.append({
+                    'strike': strike,
+                    'dte': dte,
+                    'expiry': (snap + timedelta(days=dte)).isoformat(),
+                    'bid': round(bid, 2),
+                    'credit': round(credit, 2),
+                    'netCredit': round(credit * 100 * p['contracts']),
+                    'newOtmPct': round(otm_pct, 1),
+                    'oi': oi,
+                })
+
+        if not rolls:
+            continue
+        rolls.sort(key=lambda r: (-r['netCredit'], -r['newOtmPct']))
+        results.append({
+            **p,
+            'price': round(price, 2),
+            'buyback': round(buyback, 2),
+            'rolls': rolls[:top_n],
+        })
+
+    return sorted(results, key=lambda r: -r['rolls'][0]['netCredit'])
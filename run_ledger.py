@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""run_ledger.py — pipeline 每次运行的指标账本（SQLite: run_ledger.db）
+
+run_pipeline.sh 每一步都往账本里追加结构化指标：耗时、行数、DB 文件大小、输出大小、缓存命中……
+数据量涨上来以后哪一步变慢，一眼能看出来。
+
+用法：
+  RUN_ID=$(python3 run_ledger.py start)
+  python3 run_ledger.py step "$RUN_ID" decision --since 1710000000.12 --metric rows=1234 --file-size db=iv_scanner.db
+  python3 run_ledger.py finish "$RUN_ID"
+  python3 run_ledger.py report [--runs 10] [--threshold 1.5]
+
+Python 步骤里用 record(step, {...})：环境变量 PIPELINE_RUN_ID 存在时才记，手动跑不污染账本。
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+LEDGER_DB = SCRIPT_DIR / 'run_ledger.db'
+RUN_ID_ENV = 'PIPELINE_RUN_ID'
+
+MEDIAN_WINDOW = 10       # 和最近多少次运行的中位数比
+SLOW_THRESHOLD = 1.5     # 超过中位数多少倍算变慢
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL,
+    step TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_step ON metrics (step, metric, run_id);
+'''
+
+
+def connect(db_path=LEDGER_DB):
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def start_run(db_path=LEDGER_DB):
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO runs (id, started_at) VALUES (?, ?)', (run_id, _now()))
+    finally:
+        conn.close()
+    return run_id
+
+
+def finish_run(run_id, status='ok', db_path=LEDGER_DB):
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute('UPDATE runs SET finished_at = ?, status = ? WHERE id = ?',
+                         (_now(), status, run_id))
+    finally:
+        conn.close()
+
+
+def file_size(path):
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return None
+
+
+def append_metrics(run_id, step, metrics, db_path=LEDGER_DB):
+    rows = [(run_id, step, k, v, _now()) for k, v in metrics.items() if v is not None]
+    if not rows:
+        return
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT INTO metrics (run_id, step, metric, value, recorded_at) VALUES (?, ?, ?, ?, ?)',
+                rows)
+    finally:
+        conn.close()
+
+
+def record(step, metrics, db_path=LEDGER_DB):
+    """Python 步骤的记录入口；不在 pipeline 里跑（没有 PIPELINE_RUN_ID）就什么都不做"""
+    run_id = os.environ.get(RUN_ID_ENV)
+    if not run_id:
+        return False
+    try:
+        append_metrics(run_id, step, metrics, db_path)
+    except sqlite3.Error:
+        return False     # 账本坏了也不能让 pipeline 挂掉
+    return True
+
+
+def report(runs=MEDIAN_WINDOW, threshold=SLOW_THRESHOLD, db_path=LEDGER_DB):
+    conn = connect(db_path)
+    try:
+        run_ids = [r[0] for r in conn.execute(
+            'SELECT id FROM runs ORDER BY id DESC LIMIT ?', (runs + 1,))]
+        if not run_ids:
+            print('(ledger is empty)')
+            return []
+        run_ids.reverse()
+        latest = run_ids[-1]
+        marks = ', '.join('?' for _ in run_ids)
+        values = {}
+        for run_id, step, metric, value in conn.execute(f'''
+                SELECT run_id, step, metric, value FROM metrics
+                WHERE run_id IN ({marks}) ORDER BY recorded_at
+            ''', run_ids):
+            values.setdefault((step, metric), {})[run_id] = value
+    finally:
+        conn.close()
+
+    print(f"Runs: {run_ids[0]} … {latest} ({len(run_ids)})\n")
+    slow = []
+    for (step, metric), by_run in sorted(values.items()):
+        series = [by_run.get(r) for r in run_ids]
+        history = [v for v in series[:-1] if v is not None]
+        cur = series[-1]
+        med = statistics.median(history) if history else None
+        flag = ''
+        if metric == 'duration_s' and cur is not None and med and cur > med * threshold:
+            flag = f'  ⚠️ {cur / med:.1f}x median'
+            slow.append((step, cur, med))
+        shown = ' '.join('-' if v is None else _fmt(v) for v in series[-8:])
+        med_s = _fmt(med) if med is not None else '-'
+        print(f"{step:10s} {metric:20s} median {med_s:>9s} | {shown}{flag}")
+
+    if slow:
+        print(f"\n⚠️  {len(slow)} step(s) slower than {threshold}x recent median in run {latest}")
+    return slow
+
+
+def _fmt(v):
+    if abs(v) >= 1024 * 1024:
+        return f'{v / 1024 / 1024:.1f}M'
+    if abs(v) >= 10000:
+        return f'{v / 1024:.0f}K'
+    if v == int(v):
+        return str(int(v))
+    return f'{v:.2f}'
+
+
+def _parse_pairs(pairs):
+    out = {}
+    for p in pairs or []:
+        k, _, v = p.partition('=')
+        out[k] = v
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pipeline 运行指标账本')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    sub.add_parser('start', help='开始一次运行，打印 run id')
+
+    p_step = sub.add_parser('step', help='记录一步的指标')
+    p_step.add_argument('run_id')
+    p_step.add_argument('step')
+    p_step.add_argument('--since', type=float, help='该步开始的 epoch 秒，自动算 duration_s')
+    p_step.add_argument('--metric', action='append', metavar='NAME=VALUE')
+    p_step.add_argument('--file-size', action='append', metavar='NAME=PATH',
+                        help='记录文件大小（字节），指标名为 NAME_bytes')
+
+    p_finish = sub.add_parser('finish', help='结束一次运行')
+    p_finish.add_argument('run_id')
+    p_finish.add_argument('--status', default='ok')
+
+    p_report = sub.add_parser('report', help='趋势 + 变慢的步骤')
+    p_report.add_argument('--runs', type=int, default=MEDIAN_WINDOW)
+    p_report.add_argument('--threshold', type=float, default=SLOW_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.cmd == 'start':
+        print(start_run())
+    elif args.cmd == 'step':
+        metrics = {k: float(v) for k, v in _parse_pairs(args.metric).items()}
+        for name, path in _parse_pairs(args.file_size).items():
+            metrics[f'{name}_bytes'] = file_size(path)
+        if args.since:
+            metrics['duration_s'] = round(time.time() - args.since, 3)
+        append_metrics(args.run_id, args.step, metrics)
+    elif args.cmd == 'finish':
+        finish_run(args.run_id, args.status)
+    elif args.cmd == 'report':
+        report(args.runs, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,18 @@ WORKSPACE="$HOME/.openclaw/workspace"
 LOG_DIR="$WORKSPACE/iv-scanner/logs"
 mkdir -p "$LOG_DIR"
 
+# 运行指标账本（run_ledger.db）：每步耗时 / 行数 / 文件大小，`python3 run_ledger.py report` 看趋势
+LEDGER="$WORKSPACE/cc-dashboard/run_ledger.py"
+IV_DB="$WORKSPACE/iv-scanner/data/iv_scanner.db"
+export PIPELINE_RUN_ID=$(python3 "$LEDGER" start 2>/dev/null || true)
+step_start() { STEP_T0=$(date +%s.%N); }
+step_end() { python3 "$LEDGER" step "$PIPELINE_RUN_ID" "$1" --since "$STEP_T0" "${@:2}" 2>/dev/null || true; }
+
 echo "=== $(date '+%Y-%m-%d %H:%M:%S') Pipeline Start ==="
 
 # 0. 确保 OpenD 在线
 echo "→ Step 0: Check OpenD..."
+step_start
 if ! nc -z 127.0.0.1 11111 2>/dev/null; then
     echo "   OpenD not running, starting..."
     cd /opt/futu-opend
@@ -29,33 +37,44 @@ if ! nc -z 127.0.0.1 11111 2>/dev/null; then
 else
     echo "   ✅ OpenD already running"
 fi
+step_end opend
 
 # 1. Sync portfolio from build.js
 echo "→ Step 1: Sync Portfolio..."
 cd "$WORKSPACE/cc-dashboard"
+step_start
 python3 sync_portfolio.py 2>&1 | tail -3
+step_end sync --file-size portfolio=portfolio_data.json
 
 # 2. Screener（yfinance 宽筛）
 echo "→ Step 2: Screener..."
 cd "$WORKSPACE/iv-scanner"
+step_start
 python3 screener.py --update-config 2>&1 | tail -5
+step_end screener
 
 # 3. IV Scanner（Futu 精筛）
 echo "→ Step 3: IV Scanner (Futu)..."
+step_start
 if nc -z 127.0.0.1 11111 2>/dev/null; then
     python3 run_daily.py 2>&1 | tail -5
 else
     echo "   ⚠️  Futu OpenD not available, skipping IV collection"
 fi
+step_end iv_scan --file-size iv_db="$IV_DB"
 
 # 4. Decision Engine
 echo "→ Step 4: Decision Engine..."
 cd "$WORKSPACE/cc-dashboard"
-python3 decision_engine.py 2>&1 | tail -8
+step_start
+python3 decision_engine.py --concurrent 2>&1 | tail -8
+step_end decision --file-size decision=decision_data.json
 
 # 5. CC Dashboard Build + Push
 echo "→ Step 5: Build CC Dashboard..."
+step_start
 node build.js
+step_end build --file-size index_html=index.html
 git add -A
 if ! git diff --cached --quiet; then
     git commit -m "daily update: $(date '+%Y-%m-%d')"
@@ -68,7 +87,9 @@ fi
 # 6. IV Tracker Build + Push
 echo "→ Step 6: Build IV Tracker..."
 cd "$WORKSPACE/iv-tracker"
+step_start
 python3 generate.py 2>&1 | tail -3
+step_end iv_tracker
 git add -A
 if ! git diff --cached --quiet; then
     git commit -m "data: update $(date '+%Y-%m-%d')"
@@ -78,4 +99,5 @@ else
     echo "   No IV Tracker changes"
 fi
 
+python3 "$LEDGER" finish "$PIPELINE_RUN_ID" 2>/dev/null || true
 echo "=== $(date '+%Y-%m-%d %H:%M:%S') Pipeline Done ==="
@@ -9,6 +9,7 @@ portfolio.md 里信息不全（如 sellDate / cost basis 等），这里生成
 - CC/CSP 至少提供 ticker/strike/expiry，供 cc_monitor.py/前端展示
 - CSP 尽量带 premium/collateral
 - 股票持仓写入 idlePositions（用于前端展示 + 死钱提醒）
+- weeklyIncome：按到期周预先归集好的 已实现 / 在途 / 合计，前端直接渲染
 """
 
 import json
@@ -17,6 +18,9 @@ from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
+import run_ledger
+from income_rollup import WeeklyIncomeRollup, check_baseline
+
 SCRIPT_DIR = Path(__file__).parent
 WORKSPACE = Path.home() / ".openclaw" / "workspace"
 MEMORY_DIR = WORKSPACE / "memory"
@@ -377,12 +381,26 @@ def main():
         "wheelCycles": wheel_cycles,
     }
 
+    # 到期周收入归集（口径见 OPERATIONS.md）
+    rollup = WeeklyIncomeRollup.from_portfolio(portfolio)
+    portfolio["weeklyIncome"] = rollup.series()
+
     OUTPUT.write_text(json.dumps(portfolio, indent=2, ensure_ascii=False), encoding="utf-8")
 
     print(f"✅ Portfolio synced from {PORTFOLIO_MD} → {OUTPUT}")
     print(f"   CC: {len(cc_positions)} positions")
     print(f"   CSP: {len(csp_positions)} positions")
     print(f"   Stocks: {len(stock_holdings)} holdings")
+    print(f"   Weekly income: {len(portfolio['weeklyIncome'])} weeks")
+    for err in check_baseline(rollup):
+        print(f"   ⚠️  {err}")
+
+    run_ledger.record("sync", {
+        "cc_positions": len(cc_positions),
+        "csp_positions": len(csp_positions),
+        "stock_holdings": len(stock_holdings),
+        "closed_trades": len(closed_trades),
+    })
 
 
 if __name__ == "__main__":
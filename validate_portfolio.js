@@ -20,10 +20,10 @@ const allOpen = [
 ];
 
 const toWeekKey = (dateStr) => {
-  const d = new Date(dateStr);
-  const ws = new Date(d);
-  ws.setDate(d.getDate() - d.getDay() + 1);
-  return ws.toISOString().slice(0, 10);
+  // 所在周的周一，与 income_rollup.py 的 week_key 一致：按 UTC 解析（不受浏览器时区影响），周日归本周
+  const d = new Date(String(dateStr).slice(0, 10) + 'T00:00:00Z');
+  d.setUTCDate(d.getUTCDate() - ((d.getUTCDay() + 6) % 7));
+  return d.toISOString().slice(0, 10);
 };
 
 for (const p of allOpen) {